@@ -3,10 +3,10 @@ from deepface import DeepFace
 import cv2
 import os
 import time
-import openpyxl
 import numpy as np
 import base64
 from io import BytesIO
+from attendance_sink import AttendanceSink
 
 app = Flask(__name__)  # Ensure 'app' is defined here
 
@@ -14,16 +14,11 @@ attendance_filename = r"C:\Users\admin\Desktop\FaceRecogAttendance\attendance.xl
 reference_images_path = r"C:\Users\admin\Desktop\FaceRecogAttendance\Images"
 attendance_dict = {}
 
-# Initialize Excel for attendance tracking
-def initialize_excel(filename):
-    if not os.path.exists(filename):
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Attendance"
-        sheet.append(["Name", "Date", "Time", "Status"])
-        workbook.save(filename)
-
-initialize_excel(attendance_filename)
+# Attendance rows go to an append-only CSV log; the Excel file is exported on demand
+attendance_sink = AttendanceSink(
+    os.path.splitext(attendance_filename)[0] + "_log.csv",
+    legacy_xlsx_path=attendance_filename,
+)
 
 # Load reference images
 reference_images = {}
@@ -46,12 +41,14 @@ def mark_attendance():
         return jsonify({"status": "error", "message": "No selected file"})
 
     try:
-        # Save the uploaded image to a temporary file
-        img_path = os.path.join("temp_image.png")
-        file.save(img_path)
+        # Decode the upload in memory instead of round-tripping through a temp file
+        image_bytes = file.read()
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return jsonify({"status": "error", "message": "Invalid image"})
 
         # Perform face recognition
-        results = DeepFace.find(img_path=img_path, db_path=reference_images_path, enforce_detection=False)
+        results = DeepFace.find(img_path=img, db_path=reference_images_path, enforce_detection=False)
 
         if len(results) > 0:
             match = results[0].iloc[0]
@@ -60,11 +57,10 @@ def mark_attendance():
             # Save attendance to Excel
             timestamp = time.strftime("%Y-%m-%d %H:%M:%S").split()
             row = [name, timestamp[0], timestamp[1], "Present"]
-            save_to_excel(attendance_filename, row)
+            attendance_sink.append(row)
 
             # Convert the image to base64 string to send it back
-            with open(img_path, "rb") as img_file:
-                img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+            img_base64 = base64.b64encode(image_bytes).decode('utf-8')
 
             return jsonify({
                 "status": "success",
@@ -76,14 +72,13 @@ def mark_attendance():
     except Exception as e:
         return jsonify({"status": "error", "message": f"Error: {str(e)}"})
 
-def save_to_excel(filename, row):
+@app.route('/export_attendance')
+def export_attendance():
     try:
-        workbook = openpyxl.load_workbook(filename)
-        sheet = workbook["Attendance"]
-        sheet.append(row)
-        workbook.save(filename)
+        attendance_sink.export_xlsx(attendance_filename)
+        return jsonify({"status": "success", "message": f"Attendance exported to {attendance_filename}"})
     except Exception as e:
-        print(f"Error saving to Excel: {e}")
+        return jsonify({"status": "error", "message": f"Error: {str(e)}"})
 
 if __name__ == '__main__':
     app.run(debug=True)
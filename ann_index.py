@@ -0,0 +1,148 @@
+import argparse
+import time
+
+import numpy as np
+
+DEFAULT_N_PROBE = 8
+TRAIN_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK_SIZE = 8192
+
+
+def _assign(embeddings, centroids):
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), ASSIGN_CHUNK_SIZE):
+        chunk = embeddings[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = (chunk @ centroids.T).argmax(axis=1)
+    return assignments
+
+
+def spherical_kmeans(embeddings, n_lists, n_iter=10, seed=0):
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(embeddings), n_lists * TRAIN_SAMPLE_PER_LIST)
+    sample = embeddings[rng.choice(len(embeddings), sample_size, replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        # Reseed empty lists from random training points.
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+class IVFIndex:
+    # Inverted-file index over L2-normalized rows. Instances are immutable so a
+    # gallery can swap them atomically alongside its embedding matrix.
+
+    def __init__(self, centroids, assignments, trained_size, n_probe=DEFAULT_N_PROBE):
+        self.centroids = centroids
+        self.assignments = assignments
+        self.trained_size = trained_size
+        self.n_probe = min(n_probe, len(centroids))
+        self._order = np.argsort(assignments, kind="stable")
+        self._offsets = np.searchsorted(
+            assignments[self._order], np.arange(len(centroids) + 1)
+        )
+
+    @classmethod
+    def build(cls, embeddings, n_lists=None, n_probe=DEFAULT_N_PROBE, seed=0):
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(len(embeddings))))
+        n_lists = min(n_lists, len(embeddings))
+        centroids = spherical_kmeans(embeddings, n_lists, seed=seed)
+        return cls(centroids, _assign(embeddings, centroids), len(embeddings), n_probe)
+
+    def extend(self, embeddings):
+        assignments = np.concatenate([self.assignments, _assign(embeddings, self.centroids)])
+        return IVFIndex(self.centroids, assignments, self.trained_size, self.n_probe)
+
+    def subset(self, keep):
+        return IVFIndex(self.centroids, self.assignments[keep], self.trained_size, self.n_probe)
+
+    def expected_rows(self):
+        return len(self.assignments) * self.n_probe // len(self.centroids)
+
+    def candidate_rows(self, queries):
+        scores = queries @ self.centroids.T
+        if self.n_probe < len(self.centroids):
+            probes = np.argpartition(-scores, self.n_probe - 1, axis=1)[:, :self.n_probe]
+        else:
+            probes = np.broadcast_to(np.arange(len(self.centroids)), scores.shape)
+        probes = np.unique(probes)
+        return np.concatenate(
+            [self._order[self._offsets[p]:self._offsets[p + 1]] for p in probes]
+        )
+
+
+def _synthetic_gallery(n_students, captures, dimensions, n_queries, rng):
+    centers = rng.standard_normal((n_students, dimensions)).astype(np.float32)
+    student_ids = np.repeat(np.arange(n_students), captures)
+    noise = 0.35 * rng.standard_normal((len(student_ids), dimensions)).astype(np.float32)
+    embeddings = centers[student_ids] + noise
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    query_students = rng.integers(0, n_students, n_queries)
+    queries = centers[query_students] + 0.35 * rng.standard_normal(
+        (n_queries, dimensions)
+    ).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return embeddings, student_ids, queries
+
+
+def benchmark_recall(n_students, captures, dimensions, n_queries, n_probe, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings, student_ids, queries = _synthetic_gallery(
+        n_students, captures, dimensions, n_queries, rng
+    )
+
+    started = time.perf_counter()
+    index = IVFIndex.build(embeddings, n_probe=n_probe, seed=seed)
+    build_seconds = time.perf_counter() - started
+
+    exact_hits, ann_hits = [], []
+    started = time.perf_counter()
+    for query in queries:
+        exact_hits.append(student_ids[(embeddings @ query).argmax()])
+    exact_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for query in queries:
+        rows = index.candidate_rows(query[np.newaxis, :])
+        ann_hits.append(student_ids[rows[(embeddings[rows] @ query).argmax()]])
+    ann_seconds = time.perf_counter() - started
+
+    return {
+        "gallery_size": len(embeddings),
+        "n_lists": len(index.centroids),
+        "n_probe": index.n_probe,
+        "build_seconds": build_seconds,
+        "exact_ms_per_query": 1000 * exact_seconds / n_queries,
+        "ann_ms_per_query": 1000 * ann_seconds / n_queries,
+        "recall_at_1": float(np.mean(np.array(exact_hits) == np.array(ann_hits))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall and latency of the IVF index vs exact search")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--captures", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=4096)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, default=DEFAULT_N_PROBE)
+    args = parser.parse_args()
+
+    report = benchmark_recall(
+        args.students, args.captures, args.dimensions, args.queries, args.n_probe
+    )
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -1,39 +1,144 @@
 ﻿from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Response, stream_with_context
+from flask.helpers import get_debug_flag
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-from deepface import DeepFace
-import sqlite3
+from werkzeug.serving import is_running_from_reloader
+from face_gallery import (
+    EMBEDDING_CONFIG,
+    FaceGallery,
+    blobs_to_matrix,
+    detect_faces,
+    embedding_to_blob,
+    represent_crops,
+    represent_image,
+    warmup_models,
+)
+import capture_quality
+from database import ConnectionPool, apply_migrations, explain_query_plan, plan_uses_index
+from enrollment_jobs import (
+    LATEST_JOB_QUERY,
+    NEXT_JOB_QUERY,
+    EnrollmentWorker,
+    enqueue as enqueue_enrollment,
+    job_to_json,
+    latest_job,
+)
+from frame_gate import FrameGate
+from live_feed import AttendanceFeed, format_event
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, StageTimer
+from recognition_worker import QueueFullError, RecognitionExecutor
+from session_cache import ACTIVE_SESSION_QUERY, ActiveSessionCache
+import cv2
+import numpy as np
 import os
 import uuid
 import json
+import hashlib
 import base64
 import binascii
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from functools import wraps
+from importlib import metadata
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-DB_PATH = os.path.join(BASE_DIR, "attendance.db")
-UPLOAD_DIR = os.path.join(BASE_DIR, "Images")
-TEMP_DIR = os.path.join(BASE_DIR, "temp")
+DB_PATH = os.environ.get("ATTENDANCE_DB_PATH", os.path.join(BASE_DIR, "attendance.db"))
+UPLOAD_DIR = os.environ.get("ATTENDANCE_UPLOAD_DIR", os.path.join(BASE_DIR, "Images"))
+WARMUP_LOG_PATH = os.environ.get("ATTENDANCE_WARMUP_LOG", os.path.join(BASE_DIR, "warmup_times.jsonl"))
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 MIN_STUDENT_CAPTURES = 5
+# Seconds between keep-alive comments (and database catch-up) on idle record streams.
+RECORD_STREAM_HEARTBEAT = 15
+RECORDS_PAGE_SIZE = 100
+# Side of the square face crops the dashboard uploads.
+FACE_CROP_SIZE = 224
+MAX_UPLOADED_FACES = 16
+RECORDS_MAX_PAGE_SIZE = 500
+# Galleries at least this large are searched through the IVF index.
+ANN_MIN_GALLERY_SIZE = 20000
+ANN_N_PROBE = 8
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "change-this-secret-in-production"
 app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024
+app.config["RECOGNITION_WORKERS"] = int(os.environ.get("RECOGNITION_WORKERS", 1))
+app.config["RECOGNITION_QUEUE_SIZE"] = int(os.environ.get("RECOGNITION_QUEUE_SIZE", 32))
+app.config["RECOGNITION_BATCH_SIZE"] = int(os.environ.get("RECOGNITION_BATCH_SIZE", 8))
+app.config["RECOGNITION_TIMEOUT"] = float(os.environ.get("RECOGNITION_TIMEOUT", 30))
+# Seconds between cross-worker checks of the active session cache ("off" for one process).
+app.config["ACTIVE_SESSION_CACHE_CHECK"] = os.environ.get("ACTIVE_SESSION_CACHE_CHECK", "1.0")
+# Seconds between checks for faces enrolled or deleted by other processes ("off" for one process).
+app.config["GALLERY_SYNC_CHECK"] = os.environ.get("GALLERY_SYNC_CHECK", "1.0")
+# Scripts that import the app (benchmarks) set WARMUP_ON_IMPORT=0 and call warm_up() themselves;
+# see serving_process() for the flask CLI and the reloader.
+app.config["WARMUP_ON_IMPORT"] = os.environ.get("WARMUP_ON_IMPORT", "1") != "0"
+# Enrollment keeps the best K diverse captures per student, or with
+# ENROLLMENT_CENTROID=1 a single averaged embedding.
+app.config["ENROLLMENT_KEEP_CAPTURES"] = int(os.environ.get("ENROLLMENT_KEEP_CAPTURES", 3))
+app.config["ENROLLMENT_CENTROID"] = os.environ.get("ENROLLMENT_CENTROID", "0") == "1"
+# Adds a Server-Timing header with per-stage durations to recognition responses.
+app.config["SERVER_TIMING"] = os.environ.get("SERVER_TIMING", "0") == "1"
+
+db_pool = ConnectionPool(DB_PATH)
+gallery = FaceGallery(ann_min_size=ANN_MIN_GALLERY_SIZE, ann_n_probe=ANN_N_PROBE)
+frame_gate = FrameGate()
+live_feed = AttendanceFeed()
+
+metrics = Registry()
+recognition_stage_seconds = metrics.histogram(
+    "attendance_recognition_stage_seconds",
+    "Time spent in each stage of a recognition request.",
+    ["stage"],
+)
+recognition_requests = metrics.counter(
+    "attendance_recognition_requests_total", "Recognition requests by outcome.", ["outcome"]
+)
+recognition_faces = metrics.counter(
+    "attendance_recognition_faces_total", "Faces run through matching by result.", ["result"]
+)
+attendance_marks = metrics.counter(
+    "attendance_marks_total", "Presence marks from recognition (duplicate: already marked).", ["result"]
+)
+metrics.gauge(
+    "attendance_recognition_queue_depth",
+    "Frames waiting for a recognition worker.",
+    lambda: recognition_executor.queue_depth(),
+)
+metrics.gauge("attendance_gallery_embeddings", "Embeddings in the face gallery.", lambda: len(gallery))
+metrics.gauge(
+    "attendance_record_stream_subscribers",
+    "Open live record streams.",
+    lambda: live_feed.subscriber_count(),
+)
+warmup_state = {"ready": False, "error": None, "model_seconds": None, "gallery_seconds": None}
+# Version of the "gallery" cache_versions row and highest image id the gallery holds.
+gallery_sync = {"version": None, "image_id": 0, "deletion_id": 0, "checked_at": 0.0}
+gallery_sync_lock = threading.Lock()
 
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.acquire()
+
+
+def parse_cache_check(value):
+    return None if value.lower() == "off" else float(value)
+
+
+active_sessions = ActiveSessionCache(
+    get_db_connection,
+    check_interval=parse_cache_check(app.config["ACTIVE_SESSION_CACHE_CHECK"]),
+)
 
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def save_base64_image(data_url, output_path):
+def decode_base64_image(data_url):
     if not data_url or "," not in data_url:
         raise ValueError("Image invalide")
 
@@ -45,9 +150,64 @@ def save_base64_image(data_url, output_path):
         image_bytes = base64.b64decode(encoded, validate=True)
     except binascii.Error as exc:
         raise ValueError("Image corrompue") from exc
+    return image_bytes
 
-    with open(output_path, "wb") as image_file:
-        image_file.write(image_bytes)
+
+def decode_uploaded_image(file_storage):
+    buffer = np.frombuffer(file_storage.read(), dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+
+def decode_uploaded_faces(files, boxes_raw):
+    # Square crops around the faces the browser found, plus where each crop
+    # lies in the camera frame. The faces are still detected and aligned in
+    # the crop (detect_in_crops), so they are framed like the gallery's.
+    try:
+        boxes = json.loads(boxes_raw or "[]")
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(boxes, list):
+        return None
+
+    faces = []
+    for index, file_storage in enumerate(files[:MAX_UPLOADED_FACES]):
+        crop = decode_uploaded_image(file_storage)
+        if crop is None:
+            return None
+        if crop.shape[:2] != (FACE_CROP_SIZE, FACE_CROP_SIZE):
+            crop = cv2.resize(crop, (FACE_CROP_SIZE, FACE_CROP_SIZE), interpolation=cv2.INTER_AREA)
+
+        box = boxes[index] if index < len(boxes) and isinstance(boxes[index], dict) else {}
+        try:
+            region = {key: int(box[key]) for key in ("x", "y", "w", "h")}
+        except (KeyError, TypeError, ValueError):
+            region = {"x": 0, "y": 0, "w": FACE_CROP_SIZE, "h": FACE_CROP_SIZE}
+        faces.append({"crop": crop, "region": region})
+    return faces
+
+
+def detect_in_crops(crops):
+    # The largest face of each uploaded crop, with its box mapped back to the
+    # camera frame. A crop in which the detector finds no face is dropped.
+    faces = []
+    for crop in crops:
+        found = [face for face in detect_faces(crop["crop"]) if face["confidence"] > 0]
+        if not found:
+            continue
+        face = max(found, key=lambda f: f["facial_area"]["w"] * f["facial_area"]["h"])
+        region, area = crop["region"], face["facial_area"]
+        scale_x = region["w"] / crop["crop"].shape[1]
+        scale_y = region["h"] / crop["crop"].shape[0]
+        face["facial_area"] = {
+            "x": region["x"] + int(area["x"] * scale_x),
+            "y": region["y"] + int(area["y"] * scale_y),
+            "w": int(area["w"] * scale_x),
+            "h": int(area["h"] * scale_y),
+        }
+        faces.append(face)
+    return faces
 
 
 def login_required(role=None):
@@ -66,9 +226,158 @@ def login_required(role=None):
     return decorator
 
 
+# Schema changes after the initial CREATE TABLE set. Entry n upgrades a database
+# at PRAGMA user_version n; never edit an entry once released, append a new one.
+MIGRATIONS = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_sessions_is_active ON sessions(is_active);
+    CREATE INDEX IF NOT EXISTS idx_student_images_user_id ON student_images(user_id);
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_student_id ON attendance_records(student_id);
+    CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_sessions_professor_active ON sessions(professor_id, is_active);
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('sessions', 0);
+    CREATE TRIGGER IF NOT EXISTS sessions_version_insert AFTER INSERT ON sessions
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'sessions';
+    END;
+    CREATE TRIGGER IF NOT EXISTS sessions_version_update AFTER UPDATE OF is_active ON sessions
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'sessions';
+    END
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_attendance_records_session_id ON attendance_records(session_id)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS enrollment_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending'
+            CHECK(status IN ('pending', 'running', 'done', 'failed')),
+        captures TEXT NOT NULL,
+        images INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        started_at TEXT,
+        finished_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_enrollment_jobs_status ON enrollment_jobs(status);
+    CREATE INDEX IF NOT EXISTS idx_enrollment_jobs_user_id ON enrollment_jobs(user_id)
+    """,
+    """
+    INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('gallery', 0);
+    CREATE TRIGGER IF NOT EXISTS gallery_version_insert AFTER INSERT ON face_embeddings
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'gallery';
+    END;
+    CREATE TRIGGER IF NOT EXISTS gallery_version_delete AFTER DELETE ON face_embeddings
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = 'gallery';
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS deleted_students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS deleted_students_record AFTER DELETE ON users
+    WHEN OLD.role = 'student'
+    BEGIN
+        INSERT INTO deleted_students (user_id) VALUES (OLD.id);
+    END
+    """,
+]
+
+
+def session_records_query(condition, order, limit=True):
+    return f"""
+        SELECT ar.id, u.first_name, u.last_name, ar.status, ar.marked_at
+        FROM attendance_records ar
+        JOIN users u ON u.id = ar.student_id
+        WHERE ar.session_id = ? AND {condition}
+        ORDER BY {order}
+        {"LIMIT ?" if limit else ""}
+    """
+
+
+DASHBOARD_RECORDS_QUERY = session_records_query("1 = 1", "ar.marked_at DESC", limit=False)
+RECORDS_FIRST_PAGE_QUERY = session_records_query("1 = 1", "ar.id DESC")
+RECORDS_PAGE_QUERY = session_records_query("ar.id < ?", "ar.id DESC")
+RECORDS_SINCE_ID_QUERY = session_records_query("ar.id > ?", "ar.id ASC")
+RECORDS_SINCE_TIME_QUERY = session_records_query("ar.marked_at > ?", "ar.id ASC")
+RECORDS_AFTER_ID_QUERY = session_records_query("ar.id > ?", "ar.id ASC", limit=False)
+RECORDS_STATE_QUERY = (
+    "SELECT COUNT(*), COALESCE(MAX(id), 0) FROM attendance_records WHERE session_id = ?"
+)
+STUDENT_LATEST_RECORD_QUERY = """
+    SELECT ar.status, ar.marked_at, s.start_time, s.end_time
+    FROM attendance_records ar
+    JOIN sessions s ON s.id = ar.session_id
+    WHERE ar.student_id = ?
+    ORDER BY ar.id DESC
+    LIMIT 1
+"""
+ALL_STUDENTS_QUERY = "SELECT id AS student_id FROM users WHERE role = 'student'"
+ROSTER_STUDENTS_QUERY = "SELECT student_id FROM session_students WHERE session_id = ?"
+SESSION_HAS_ROSTER_QUERY = "SELECT 1 FROM session_students WHERE session_id = ? LIMIT 1"
+SESSION_CANDIDATES_QUERY = """
+    SELECT ss.student_id, EXISTS (
+        SELECT 1 FROM attendance_records ar
+        WHERE ar.session_id = ss.session_id AND ar.student_id = ss.student_id
+    ) AS marked
+    FROM session_students ss
+    WHERE ss.session_id = ?
+"""
+STUDENT_IMAGES_QUERY = "SELECT image_path FROM student_images WHERE user_id = ?"
+GALLERY_VERSION_QUERY = "SELECT version FROM cache_versions WHERE name = 'gallery'"
+GALLERY_ROWS_SINCE_QUERY = """
+    SELECT fe.image_id, si.user_id, fe.dimensions, fe.embedding
+    FROM face_embeddings fe
+    JOIN student_images si ON si.id = fe.image_id
+    WHERE fe.image_id > ?
+      AND fe.model_name = ? AND fe.detector_backend = ? AND fe.normalization = ?
+    ORDER BY fe.image_id
+"""
+DELETED_STUDENTS_SINCE_QUERY = "SELECT id, user_id FROM deleted_students WHERE id > ? ORDER BY id"
+LAST_DELETION_QUERY = "SELECT COALESCE(MAX(id), 0) FROM deleted_students"
+GALLERY_COUNT_QUERY = """
+    SELECT COUNT(*) FROM face_embeddings
+    WHERE model_name = ? AND detector_backend = ? AND normalization = ?
+"""
+
+# Queries run on every request or page load; each must be served by an index.
+HOT_QUERIES = {
+    "active_session": (ACTIVE_SESSION_QUERY, (1,)),
+    "student_latest_record": (STUDENT_LATEST_RECORD_QUERY, (1,)),
+    "all_students": (ALL_STUDENTS_QUERY, ()),
+    "roster_students": (ROSTER_STUDENTS_QUERY, (1,)),
+    "session_has_roster": (SESSION_HAS_ROSTER_QUERY, (1,)),
+    "student_images": (STUDENT_IMAGES_QUERY, (1,)),
+    "gallery_version": (GALLERY_VERSION_QUERY, ()),
+    "gallery_rows_since": (GALLERY_ROWS_SINCE_QUERY, (1,) + EMBEDDING_CONFIG),
+    "deleted_students_since": (DELETED_STUDENTS_SINCE_QUERY, (1,)),
+    "dashboard_records": (DASHBOARD_RECORDS_QUERY, (1,)),
+    "records_first_page": (RECORDS_FIRST_PAGE_QUERY, (1, RECORDS_PAGE_SIZE)),
+    "records_page": (RECORDS_PAGE_QUERY, (1, 1000, RECORDS_PAGE_SIZE)),
+    "records_since_id": (RECORDS_SINCE_ID_QUERY, (1, 1000, RECORDS_PAGE_SIZE)),
+    "records_since_time": (RECORDS_SINCE_TIME_QUERY, (1, "2000-01-01", RECORDS_PAGE_SIZE)),
+    "records_after_id": (RECORDS_AFTER_ID_QUERY, (1, 1000)),
+    "records_state": (RECORDS_STATE_QUERY, (1,)),
+    "session_candidates": (SESSION_CANDIDATES_QUERY, (1,)),
+    "enrollment_next_job": (NEXT_JOB_QUERY, ()),
+    "enrollment_latest_job": (LATEST_JOB_QUERY, (1,)),
+}
+
+
 def init_db():
     os.makedirs(UPLOAD_DIR, exist_ok=True)
-    os.makedirs(TEMP_DIR, exist_ok=True)
 
     conn = get_db_connection()
     conn.executescript(
@@ -91,6 +400,17 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         );
 
+        CREATE TABLE IF NOT EXISTS face_embeddings (
+            image_id INTEGER PRIMARY KEY,
+            model_name TEXT NOT NULL,
+            detector_backend TEXT NOT NULL,
+            normalization TEXT NOT NULL,
+            dimensions INTEGER NOT NULL,
+            embedding BLOB NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (image_id) REFERENCES student_images(id) ON DELETE CASCADE
+        );
+
         CREATE TABLE IF NOT EXISTS sessions (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             professor_id INTEGER NOT NULL,
@@ -100,6 +420,14 @@ def init_db():
             FOREIGN KEY (professor_id) REFERENCES users(id)
         );
 
+        CREATE TABLE IF NOT EXISTS session_students (
+            session_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            PRIMARY KEY (session_id, student_id),
+            FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+
         CREATE TABLE IF NOT EXISTS attendance_records (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id INTEGER NOT NULL,
@@ -113,69 +441,533 @@ def init_db():
         """
     )
     conn.commit()
+    apply_migrations(conn, MIGRATIONS)
     conn.close()
 
 
-def get_active_session_id():
+def audit_query_plans():
     conn = get_db_connection()
-    row = conn.execute(
-        "SELECT id FROM sessions WHERE is_active = 1 ORDER BY id DESC LIMIT 1"
-    ).fetchone()
+    report = {
+        name: explain_query_plan(conn, sql, params)
+        for name, (sql, params) in HOT_QUERIES.items()
+    }
     conn.close()
-    return row["id"] if row else None
+    return report
+
+
+@app.cli.command("audit-queries")
+def audit_queries_command():
+    failures = 0
+    for name, plan in audit_query_plans().items():
+        ok = plan_uses_index(plan)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'SCAN'} {name}: {' | '.join(plan)}")
+    if failures:
+        raise SystemExit(1)
+
+
+def get_active_session_id(professor_id):
+    return active_sessions.get(professor_id)
+
+
+def parse_roster(roster_raw):
+    return {
+        email.strip().lower()
+        for email in roster_raw.replace(",", "\n").replace(";", "\n").splitlines()
+        if email.strip()
+    }
+
+
+def get_session_candidates(conn, session_id):
+    has_roster = conn.execute(SESSION_HAS_ROSTER_QUERY, (session_id,)).fetchone()
+    # Sessions without a roster are matched against everyone.
+    if not has_roster:
+        return None
+
+    # The whole roster, marked students included: leaving them out would match
+    # a marked student still in view against their nearest classmate. Their
+    # match only skips the insert. Once everyone is marked there is nothing
+    # left to find and the frame is not even run through detection.
+    rows = conn.execute(SESSION_CANDIDATES_QUERY, (session_id,)).fetchall()
+    if all(row["marked"] for row in rows):
+        return set()
+    return {row["student_id"] for row in rows}
 
 
 def close_session_and_mark_absent(session_id):
     conn = get_db_connection()
     now = datetime.utcnow().isoformat()
 
-    students = conn.execute("SELECT id FROM users WHERE role = 'student'").fetchall()
-    for student in students:
-        exists = conn.execute(
-            "SELECT 1 FROM attendance_records WHERE session_id = ? AND student_id = ?",
-            (session_id, student["id"]),
-        ).fetchone()
-        if not exists:
-            conn.execute(
-                """
-                INSERT INTO attendance_records (session_id, student_id, status, marked_at)
-                VALUES (?, ?, 'absent', ?)
-                """,
-                (session_id, student["id"], now),
-            )
+    has_roster = conn.execute(SESSION_HAS_ROSTER_QUERY, (session_id,)).fetchone()
+    if has_roster:
+        students_query, students_params = ROSTER_STUDENTS_QUERY, (session_id,)
+    else:
+        students_query, students_params = ALL_STUDENTS_QUERY, ()
+
+    # One set-based insert; UNIQUE(session_id, student_id) skips students already marked.
+    with conn:
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO attendance_records (session_id, student_id, status, marked_at)
+            SELECT ?, students.student_id, 'absent', ?
+            FROM ({students_query}) AS students
+            """,
+            (session_id, now) + students_params,
+        )
+        conn.execute(
+            "UPDATE sessions SET is_active = 0, end_time = ? WHERE id = ?",
+            (now, session_id),
+        )
+    conn.close()
+    live_feed.notify(session_id)
 
-    conn.execute(
-        "UPDATE sessions SET is_active = 0, end_time = ? WHERE id = ?",
-        (now, session_id),
+
+def record_to_json(row):
+    return {
+        "id": row["id"],
+        "student": f"{row['first_name']} {row['last_name']}",
+        "status": row["status"],
+        "marked_at": row["marked_at"],
+    }
+
+
+def fetch_records_since(conn, session_id, last_id):
+    rows = conn.execute(RECORDS_AFTER_ID_QUERY, (session_id, last_id)).fetchall()
+    return [record_to_json(row) for row in rows]
+
+
+def embed_student_images(rows):
+    image_ids, student_ids, vectors = [], [], []
+    for image_id, user_id, image_path in rows:
+        if not os.path.exists(image_path):
+            continue
+        embeddings = represent_image(image_path)
+        if not embeddings:
+            continue
+        image_ids.append(image_id)
+        student_ids.append(user_id)
+        vectors.append(embeddings[0])
+    return image_ids, student_ids, vectors
+
+
+def store_embeddings(conn, image_ids, vectors):
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO face_embeddings
+            (image_id, model_name, detector_backend, normalization, dimensions, embedding)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (image_id, *EMBEDDING_CONFIG, len(vector), embedding_to_blob(vector))
+            for image_id, vector in zip(image_ids, vectors)
+        ],
     )
+
+
+def load_gallery():
+    conn = get_db_connection()
+    # The version is read in the same snapshot as the rows; any later change moves it on.
+    conn.execute("BEGIN")
+    version = conn.execute(GALLERY_VERSION_QUERY).fetchone()[0]
+    deletion_id = conn.execute(LAST_DELETION_QUERY).fetchone()[0]
+    rows = conn.execute(
+        """
+        SELECT si.id, si.user_id, si.image_path, fe.dimensions, fe.embedding
+        FROM student_images si
+        LEFT JOIN face_embeddings fe
+            ON fe.image_id = si.id
+            AND fe.model_name = ?
+            AND fe.detector_backend = ?
+            AND fe.normalization = ?
+        ORDER BY si.id
+        """,
+        EMBEDDING_CONFIG,
+    ).fetchall()
+
+    conn.commit()
+
+    stored = [row for row in rows if row["embedding"] is not None]
+    missing = [
+        (row["id"], row["user_id"], row["image_path"])
+        for row in rows
+        if row["embedding"] is None
+    ]
+
+    image_ids = [row["id"] for row in stored]
+    student_ids = [row["user_id"] for row in stored]
+    vectors = blobs_to_matrix(
+        [row["embedding"] for row in stored],
+        stored[0]["dimensions"] if stored else 0,
+    )
+
+    # Images registered before embeddings were persisted are embedded once here.
+    if missing:
+        new_image_ids, new_student_ids, new_vectors = embed_student_images(missing)
+        store_embeddings(conn, new_image_ids, new_vectors)
+        conn.commit()
+        image_ids += new_image_ids
+        student_ids += new_student_ids
+        if new_vectors:
+            vectors = np.concatenate([vectors.reshape(-1, len(new_vectors[0])), new_vectors])
+
+    conn.close()
+    gallery.load(image_ids, student_ids, vectors)
+    gallery_sync["version"] = version
+    gallery_sync["image_id"] = max(image_ids, default=0)
+    gallery_sync["deletion_id"] = deletion_id
+
+
+def sync_gallery():
+    # Faces enrolled or deleted by other processes (enrollment workers, the
+    # bulk importer, delete-student) bump the "gallery" row of cache_versions.
+    # At most every GALLERY_SYNC_CHECK seconds the version is re-read; new
+    # embeddings are added and students recorded in deleted_students removed,
+    # both without rebuilding the gallery.
+    interval = parse_cache_check(app.config["GALLERY_SYNC_CHECK"])
+    now = time.monotonic()
+    if interval is None or now - gallery_sync["checked_at"] < interval:
+        return
+    # Another request is already syncing; matching against the current gallery is fine.
+    if not gallery_sync_lock.acquire(blocking=False):
+        return
+    try:
+        gallery_sync["checked_at"] = now
+        conn = get_db_connection()
+        try:
+            # One read snapshot for the version, the changes and the count.
+            conn.execute("BEGIN")
+            version = conn.execute(GALLERY_VERSION_QUERY).fetchone()[0]
+            if version == gallery_sync["version"]:
+                return
+            rows = conn.execute(
+                GALLERY_ROWS_SINCE_QUERY, (gallery_sync["image_id"],) + EMBEDDING_CONFIG
+            ).fetchall()
+            deletions = conn.execute(
+                DELETED_STUDENTS_SINCE_QUERY, (gallery_sync["deletion_id"],)
+            ).fetchall()
+            total = conn.execute(GALLERY_COUNT_QUERY, EMBEDDING_CONFIG).fetchone()[0]
+        finally:
+            conn.close()
+
+        for deletion in deletions:
+            gallery.remove_student(deletion["user_id"])
+        if deletions:
+            gallery_sync["deletion_id"] = deletions[-1]["id"]
+
+        if rows:
+            gallery.add(
+                [row["image_id"] for row in rows],
+                [row["user_id"] for row in rows],
+                blobs_to_matrix([row["embedding"] for row in rows], rows[0]["dimensions"]),
+            )
+            gallery_sync["image_id"] = rows[-1]["image_id"]
+        gallery_sync["version"] = version
+        # Counts still differ: embeddings were backfilled below the watermark.
+        if len(gallery) != total:
+            load_gallery()
+    finally:
+        gallery_sync_lock.release()
+
+
+def delete_student(student_id):
+    conn = get_db_connection()
+    paths = [
+        row["image_path"]
+        for row in conn.execute(STUDENT_IMAGES_QUERY, (student_id,))
+    ]
+    # student_images and attendance_records follow through ON DELETE CASCADE.
+    conn.execute("DELETE FROM users WHERE id = ? AND role = 'student'", (student_id,))
     conn.commit()
     conn.close()
 
+    # Running servers drop the student from their gallery through the
+    # deleted_students row the delete trigger wrote (see sync_gallery).
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@app.cli.command("delete-student")
+@click.argument("email")
+def delete_student_command(email):
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT id FROM users WHERE email = ? AND role = 'student'", (email.strip().lower(),)
+    ).fetchone()
+    conn.close()
+    if row is None:
+        raise click.ClickException(f"No student with email {email}")
+    delete_student(row["id"])
+    print(f"Deleted student {email} and their face images")
+
+
+def store_student_captures(conn, user_id, captures):
+    # captures: (file name suffix, image bytes, embedding). Writes the files
+    # and inserts their image and embedding rows in the caller's transaction;
+    # returns the new image ids and the written paths.
+    image_ids, saved_paths = [], []
+    try:
+        for suffix, image_bytes, _ in captures:
+            save_path = os.path.join(UPLOAD_DIR, f"{user_id}__{suffix}__{uuid.uuid4().hex}.jpg")
+            with open(save_path, "wb") as image_file:
+                image_file.write(image_bytes)
+            saved_paths.append(save_path)
+            image_ids.append(
+                conn.execute(
+                    "INSERT INTO student_images (user_id, image_path) VALUES (?, ?)",
+                    (user_id, save_path),
+                ).lastrowid
+            )
+        store_embeddings(conn, image_ids, [vector for _, _, vector in captures])
+    except Exception:
+        remove_files(saved_paths)
+        raise
+    return image_ids, saved_paths
+
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def process_enrollment_job(job):
+    # Decode every capture, keep the best diverse faces, then write their files
+    # and insert all image and embedding rows in one transaction.
+    user_id = job["user_id"]
+    decoded = []
+    for index, data_url in enumerate(json.loads(job["captures"]), start=1):
+        try:
+            image_bytes = decode_base64_image(data_url)
+        except ValueError:
+            continue
+        img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            decoded.append((index, image_bytes, img))
+
+    kept, rejected = capture_quality.embed_captures(
+        [img for _, _, img in decoded],
+        app.config["ENROLLMENT_KEEP_CAPTURES"],
+        app.config["ENROLLMENT_CENTROID"],
+    )
+    if not kept:
+        if rejected:
+            raise ValueError(f"Captures inutilisables ({', '.join(sorted(set(rejected)))})")
+        raise ValueError("Aucune capture lisible")
+
+    captures = [
+        (f"cap{decoded[i][0]}", decoded[i][1], vector) for i, vector in kept
+    ]
+    conn = get_db_connection()
+    try:
+        image_ids, saved_paths = store_student_captures(conn, user_id, captures)
+        try:
+            conn.commit()
+        except Exception:
+            remove_files(saved_paths)
+            raise
+    finally:
+        conn.close()
+
+    gallery.add(image_ids, [user_id] * len(image_ids), [vector for _, vector in kept])
+    return len(image_ids)
 
-def detect_student_from_image(temp_image_path):
-    results = DeepFace.find(
-        img_path=temp_image_path,
-        db_path=UPLOAD_DIR,
-        enforce_detection=False,
-        detector_backend="opencv",
-        silent=True,
+
+enrollment_worker = EnrollmentWorker(get_db_connection, process_enrollment_job)
+
+
+def warm_up():
+    started = time.perf_counter()
+    try:
+        warmup_models()
+        models_loaded = time.perf_counter()
+        load_gallery()
+    except Exception as exc:
+        warmup_state["error"] = str(exc)
+        app.logger.exception("Warm-up failed")
+        return
+
+    warmup_state["model_seconds"] = models_loaded - started
+    warmup_state["gallery_seconds"] = time.perf_counter() - models_loaded
+    recognition_executor.start()
+    enrollment_worker.start()
+    warmup_state["ready"] = True
+    app.logger.info(
+        "Warm-up done: models %.2fs, gallery %.2fs (%d embeddings)",
+        warmup_state["model_seconds"],
+        warmup_state["gallery_seconds"],
+        len(gallery),
     )
 
-    if not results or len(results[0]) == 0:
-        return None
+    try:
+        deepface_version = metadata.version("deepface")
+    except metadata.PackageNotFoundError:
+        deepface_version = None
+    with open(WARMUP_LOG_PATH, "a", encoding="utf-8") as log_file:
+        log_file.write(
+            json.dumps(
+                {
+                    "finished_at": datetime.utcnow().isoformat(),
+                    "deepface_version": deepface_version,
+                    "model_seconds": warmup_state["model_seconds"],
+                    "gallery_seconds": warmup_state["gallery_seconds"],
+                    "gallery_size": len(gallery),
+                }
+            )
+            + "\n"
+        )
 
-    match = results[0].iloc[0]
-    identity_path = match["identity"]
-    filename = os.path.basename(identity_path)
 
-    if "__" not in filename:
-        return None
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def serving_process():
+    # Only a process that will serve requests warms up on import: not flask
+    # CLI commands other than "run" (audit-queries, delete-student), and not
+    # the reloader's watcher process, which only restarts the real server.
+    if is_running_from_reloader():
+        return True
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        ctx = click.get_current_context(silent=True)
+        if ctx is None or ctx.info_name != "run":
+            return False
+        reload = ctx.params.get("reload")
+        return not (get_debug_flag() if reload is None else reload)
+    # "python app.py" always runs the reloader (debug=True): its child warms up.
+    return __name__ != "__main__"
+
+
+def match_faces(faces, embeddings, candidate_ids):
+    # Returns the matched students and the number of faces nobody matched.
+    if not faces:
+        return [], 0
+
+    matches = gallery.match(embeddings, candidate_ids=candidate_ids)
+
+    # Keep the closest face when one student matches several faces.
+    best = {}
+    for face, match in zip(faces, matches):
+        if match is None:
+            continue
+        student_id, distance = match
+        if student_id not in best or distance < best[student_id]["distance"]:
+            best[student_id] = {
+                "student_id": student_id,
+                "distance": distance,
+                "facial_area": face["facial_area"],
+            }
+    return list(best.values()), matches.count(None)
+
+
+def recognize_batch(jobs):
+    # Detection runs per frame (unless the client sent crops); the crops of
+    # every frame share one embedding pass. Stage timings cover the whole
+    # batch and are reported to every job in it.
+    timer = StageTimer()
+    frames_faces = []
+    with timer.stage("detect"):
+        for job in jobs:
+            candidate_ids = job["candidate_ids"]
+            if candidate_ids is not None and not candidate_ids:
+                frames_faces.append([])
+            elif "crops" in job:
+                frames_faces.append(detect_in_crops(job["crops"]))
+            else:
+                frames_faces.append(detect_faces(job["image"]))
+
+    with timer.stage("embed"):
+        embeddings = represent_crops(
+            [face["crop"] for faces in frames_faces for face in faces]
+        )
 
-    student_id = filename.split("__", 1)[0]
-    if not student_id.isdigit():
-        return None
+    results = []
+    offset = 0
+    with timer.stage("match"):
+        for job, faces in zip(jobs, frames_faces):
+            frame_embeddings = embeddings[offset:offset + len(faces)]
+            offset += len(faces)
+            detections, unknown = match_faces(faces, frame_embeddings, job["candidate_ids"])
+            results.append(
+                {"detections": detections, "faces": len(faces), "unknown": unknown}
+            )
+    for result in results:
+        result["timings"] = timer.timings
+    return results
+
+
+recognition_executor = RecognitionExecutor(
+    recognize_batch,
+    workers=app.config["RECOGNITION_WORKERS"],
+    queue_size=app.config["RECOGNITION_QUEUE_SIZE"],
+    max_batch=app.config["RECOGNITION_BATCH_SIZE"],
+)
+
+
+def build_recognition_payload(session_id, detections):
+    if not detections:
+        return {"status": "error", "message": "Aucun etudiant reconnu"}
+
+    conn = get_db_connection()
+    students = mark_students_present(conn, session_id, detections)
+    conn.close()
 
-    return int(student_id)
+    if not students:
+        return {"status": "error", "message": "Etudiant inconnu"}
+
+    newly_marked = any(s["message"] == "Presence marquee" for s in students)
+    return {
+        "status": "success",
+        "message": "Presence marquee" if newly_marked else "Presence deja marquee",
+        "student": ", ".join(s["student"] for s in students),
+        "students": students,
+    }
+
+
+def mark_students_present(conn, session_id, detections):
+    if not detections:
+        return []
+
+    now = datetime.utcnow().isoformat()
+    student_ids = [detection["student_id"] for detection in detections]
+    placeholders = ",".join("?" * len(student_ids))
+    students = {
+        row["id"]: row
+        for row in conn.execute(
+            f"""
+            SELECT id, first_name, last_name FROM users
+            WHERE role = 'student' AND id IN ({placeholders})
+            """,
+            student_ids,
+        )
+    }
+
+    marked = []
+    inserted = False
+    for detection in detections:
+        student = students.get(detection["student_id"])
+        if not student:
+            continue
+        name = f"{student['first_name']} {student['last_name']}"
+        cursor = conn.execute(
+            """
+            INSERT OR IGNORE INTO attendance_records (session_id, student_id, status, marked_at)
+            VALUES (?, ?, 'present', ?)
+            """,
+            (session_id, student["id"], now),
+        )
+        inserted = inserted or bool(cursor.rowcount)
+        marked.append(
+            {
+                "student": name,
+                "message": "Presence marquee" if cursor.rowcount else "Presence deja marquee",
+                "facial_area": detection["facial_area"],
+            }
+        )
+    conn.commit()
+    if inserted:
+        live_feed.notify(session_id)
+    return marked
 
 
 @app.route("/")
@@ -187,6 +979,23 @@ def home():
     return redirect(url_for("login"))
 
 
+def parse_captures(captures_raw):
+    # Returns (captures, error message) for the captures_json of a form.
+    try:
+        captures = json.loads(captures_raw)
+    except json.JSONDecodeError:
+        return [], "Donnees camera invalides"
+
+    if not isinstance(captures, list):
+        return [], "Donnees camera invalides"
+    valid_captures = [
+        c for c in captures if isinstance(c, dict) and isinstance(c.get("data"), str)
+    ]
+    if len(valid_captures) < MIN_STUDENT_CAPTURES:
+        return [], "Capturez au minimum 5 images"
+    return valid_captures, None
+
+
 @app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
@@ -207,22 +1016,10 @@ def register():
 
         captures = []
         if role == "student":
-            try:
-                captures = json.loads(captures_raw)
-            except json.JSONDecodeError:
-                flash("Donnees camera invalides", "error")
-                return redirect(url_for("register"))
-
-            if not isinstance(captures, list):
-                flash("Donnees camera invalides", "error")
+            captures, error = parse_captures(captures_raw)
+            if error:
+                flash(error, "error")
                 return redirect(url_for("register"))
-            valid_captures = [
-                c for c in captures if isinstance(c, dict) and c.get("data")
-            ]
-            if len(valid_captures) < MIN_STUDENT_CAPTURES:
-                flash("Capturez au minimum 5 images", "error")
-                return redirect(url_for("register"))
-            captures = valid_captures
 
         conn = get_db_connection()
         existing = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
@@ -241,36 +1038,17 @@ def register():
         user_id = cursor.lastrowid
 
         if role == "student":
-            saved_paths = []
-            try:
-                for index, capture in enumerate(captures, start=1):
-                    if not isinstance(capture, dict):
-                        continue
-
-                    data_url = capture.get("data")
-                    if not data_url:
-                        continue
-
-                    filename = f"{user_id}__cap{index}__{uuid.uuid4().hex}.jpg"
-                    save_path = os.path.join(UPLOAD_DIR, filename)
-                    save_base64_image(data_url, save_path)
-                    saved_paths.append(save_path)
-
-                    conn.execute(
-                        "INSERT INTO student_images (user_id, image_path) VALUES (?, ?)",
-                        (user_id, save_path),
-                    )
-            except ValueError:
-                conn.rollback()
-                conn.close()
-                for path in saved_paths:
-                    if os.path.exists(path):
-                        os.remove(path)
-                flash("Erreur lors de la sauvegarde des captures", "error")
-                return redirect(url_for("register"))
+            # Decoding, face checks and embedding run in the enrollment worker.
+            enqueue_enrollment(conn, user_id, [capture["data"] for capture in captures])
 
         conn.commit()
         conn.close()
+
+        if role == "student":
+            enrollment_worker.notify()
+            flash("Compte cree, vos photos sont en cours de traitement", "success")
+            return redirect(url_for("login"))
+
         flash("Compte cree avec succes", "success")
         return redirect(url_for("login"))
 
@@ -311,18 +1089,11 @@ def logout():
 @app.route("/prof/dashboard")
 @login_required(role="professor")
 def prof_dashboard():
-    active_session_id = get_active_session_id()
+    active_session_id = get_active_session_id(session["user_id"])
 
     conn = get_db_connection()
     rows = conn.execute(
-        """
-        SELECT ar.status, ar.marked_at, u.first_name, u.last_name
-        FROM attendance_records ar
-        JOIN users u ON u.id = ar.student_id
-        WHERE ar.session_id = ?
-        ORDER BY ar.marked_at DESC
-        """,
-        (active_session_id,) if active_session_id else (-1,),
+        DASHBOARD_RECORDS_QUERY, (active_session_id,) if active_session_id else (-1,)
     ).fetchall()
     conn.close()
 
@@ -330,6 +1101,7 @@ def prof_dashboard():
         "prof_dashboard.html",
         active_session_id=active_session_id,
         records=rows,
+        last_record_id=max((r["id"] for r in rows), default=0),
     )
 
 
@@ -339,38 +1111,90 @@ def student_dashboard():
     student_id = session["user_id"]
 
     conn = get_db_connection()
-    row = conn.execute(
-        """
-        SELECT ar.status, ar.marked_at, s.start_time, s.end_time
-        FROM attendance_records ar
-        JOIN sessions s ON s.id = ar.session_id
-        WHERE ar.student_id = ?
-        ORDER BY ar.id DESC
-        LIMIT 1
-        """,
-        (student_id,),
-    ).fetchone()
+    row = conn.execute(STUDENT_LATEST_RECORD_QUERY, (student_id,)).fetchone()
+    job = latest_job(conn, student_id)
+    conn.close()
+
+    return render_template("student_dashboard.html", record=row, enrollment=job)
+
+
+@app.route("/api/student/enrollment")
+@login_required(role="student")
+def api_student_enrollment():
+    conn = get_db_connection()
+    job = latest_job(conn, session["user_id"])
     conn.close()
+    return jsonify(job_to_json(job))
+
+
+@app.route("/student/enrollment", methods=["POST"])
+@login_required(role="student")
+def resubmit_enrollment():
+    # New captures after a failed job, so the account is not stuck without a face.
+    captures, error = parse_captures(request.form.get("captures_json", "[]"))
+    if error:
+        flash(error, "error")
+        return redirect(url_for("student_dashboard"))
+
+    conn = get_db_connection()
+    try:
+        # Checked and enqueued in one write transaction: a double submit makes one job.
+        conn.execute("BEGIN IMMEDIATE")
+        job = latest_job(conn, session["user_id"])
+        if job is not None and job["status"] != "failed":
+            flash("Vos photos sont deja enregistrees ou en cours de traitement", "error")
+            return redirect(url_for("student_dashboard"))
+        enqueue_enrollment(conn, session["user_id"], [capture["data"] for capture in captures])
+        conn.commit()
+    finally:
+        conn.close()
 
-    return render_template("student_dashboard.html", record=row)
+    enrollment_worker.notify()
+    flash("Vos photos sont en cours de traitement", "success")
+    return redirect(url_for("student_dashboard"))
 
 
 @app.route("/prof/session/start", methods=["POST"])
 @login_required(role="professor")
 def start_session():
-    active_session_id = get_active_session_id()
+    active_session_id = get_active_session_id(session["user_id"])
     if active_session_id:
         flash("Une seance est deja active", "error")
         return redirect(url_for("prof_dashboard"))
 
+    roster_emails = parse_roster(request.form.get("roster", ""))
+
     conn = get_db_connection()
+    if roster_emails:
+        placeholders = ",".join("?" * len(roster_emails))
+        student_ids = [
+            row["id"]
+            for row in conn.execute(
+                f"SELECT id FROM users WHERE role = 'student' AND email IN ({placeholders})",
+                tuple(roster_emails),
+            )
+        ]
+        if not student_ids:
+            conn.close()
+            flash("Aucun etudiant de la liste n'est inscrit", "error")
+            return redirect(url_for("prof_dashboard"))
+    else:
+        # No roster rows: the session covers every student, including those
+        # who register after it starts.
+        student_ids = []
+
     cursor = conn.execute(
         "INSERT INTO sessions (professor_id, start_time, is_active) VALUES (?, ?, 1)",
         (session["user_id"], datetime.utcnow().isoformat()),
     )
+    conn.executemany(
+        "INSERT INTO session_students (session_id, student_id) VALUES (?, ?)",
+        [(cursor.lastrowid, student_id) for student_id in student_ids],
+    )
     conn.commit()
     conn.close()
 
+    active_sessions.set(session["user_id"], cursor.lastrowid)
     flash(f"Seance {cursor.lastrowid} demarree", "success")
     return redirect(url_for("prof_dashboard"))
 
@@ -378,125 +1202,233 @@ def start_session():
 @app.route("/prof/session/stop", methods=["POST"])
 @login_required(role="professor")
 def stop_session():
-    active_session_id = get_active_session_id()
+    active_session_id = get_active_session_id(session["user_id"])
     if not active_session_id:
         flash("Aucune seance active", "error")
         return redirect(url_for("prof_dashboard"))
 
     close_session_and_mark_absent(active_session_id)
+    active_sessions.set(session["user_id"], None)
+    frame_gate.forget(active_session_id)
     flash("Seance terminee. Les absences ont ete marquees.", "success")
     return redirect(url_for("prof_dashboard"))
 
 
-@app.route("/api/attendance/recognize", methods=["POST"])
-@login_required(role="professor")
-def recognize_attendance():
-    active_session_id = get_active_session_id()
-    if not active_session_id:
-        return jsonify({"status": "error", "message": "Aucune seance active"}), 400
+@app.route("/api/health/ready")
+def readiness():
+    if warmup_state["error"]:
+        return jsonify({"status": "error", "message": warmup_state["error"]}), 503
+    if not warmup_state["ready"]:
+        return jsonify({"status": "warming_up"}), 503
+    return jsonify(
+        {
+            "status": "ready",
+            "model_seconds": warmup_state["model_seconds"],
+            "gallery_seconds": warmup_state["gallery_seconds"],
+            "gallery_size": len(gallery),
+        }
+    )
 
-    image = request.files.get("image")
-    if not image or not image.filename:
-        return jsonify({"status": "error", "message": "Image manquante"}), 400
 
-    if not allowed_file(image.filename):
-        return jsonify({"status": "error", "message": "Format image invalide"}), 400
+def run_recognition(timer):
+    # Returns (payload, HTTP status, outcome label for the metrics).
+    if not warmup_state["ready"]:
+        return {"status": "error", "message": "Modeles en cours de chargement"}, 503, "not_ready"
 
-    temp_filename = f"temp_{uuid.uuid4().hex}.jpg"
-    temp_path = os.path.join(TEMP_DIR, temp_filename)
-    image.save(temp_path)
+    with timer.stage("session"):
+        active_session_id = get_active_session_id(session["user_id"])
+    if not active_session_id:
+        return {"status": "error", "message": "Aucune seance active"}, 400, "no_session"
+
+    with timer.stage("decode"):
+        face_files = request.files.getlist("faces")
+        if face_files:
+            # Crop mode: the dashboard already found the faces, only their
+            # small crops are run through detection.
+            crops = decode_uploaded_faces(face_files, request.form.get("boxes_json"))
+            if crops is None:
+                return {"status": "error", "message": "Visages corrompus"}, 400, "bad_request"
+            job = {"crops": crops}
+            frame = np.hstack([crop["crop"] for crop in crops])
+        else:
+            image = request.files.get("image")
+            if not image or not image.filename:
+                return {"status": "error", "message": "Image manquante"}, 400, "bad_request"
+
+            if not allowed_file(image.filename):
+                return {"status": "error", "message": "Format image invalide"}, 400, "bad_request"
+
+            frame = decode_uploaded_image(image)
+            if frame is None:
+                return {"status": "error", "message": "Image corrompue"}, 400, "bad_request"
+            job = {"image": frame}
+
+    # A static scene gets the answer computed for it last time.
+    with timer.stage("gate"):
+        signature, cached = frame_gate.check(active_session_id, frame)
+    if cached is not None:
+        return {**cached, "cached": True}, 200, "cached"
+
+    with timer.stage("candidates"):
+        sync_gallery()
+        conn = get_db_connection()
+        job["candidate_ids"] = get_session_candidates(conn, active_session_id)
+        conn.close()
 
+    submitted = time.perf_counter()
     try:
-        student_id = detect_student_from_image(temp_path)
+        future = recognition_executor.submit(job)
+        result = future.result(timeout=app.config["RECOGNITION_TIMEOUT"])
+    except QueueFullError:
+        return {"status": "error", "message": "Serveur sature, reessayez"}, 429, "rejected"
+    except FutureTimeoutError:
+        future.cancel()
+        return {"status": "error", "message": "Reconnaissance trop lente"}, 504, "timeout"
     except Exception as exc:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        return jsonify({"status": "error", "message": f"Erreur reconnaissance: {exc}"}), 500
+        return {"status": "error", "message": f"Erreur reconnaissance: {exc}"}, 500, "error"
+
+    waited = time.perf_counter() - submitted - sum(result["timings"].values())
+    timer.add("queue", max(waited, 0.0))
+    for stage, seconds in result["timings"].items():
+        timer.add(stage, seconds)
+    recognition_faces.inc(result["faces"] - result["unknown"], result="matched")
+    recognition_faces.inc(result["unknown"], result="unknown")
+
+    with timer.stage("db_write"):
+        payload = build_recognition_payload(active_session_id, result["detections"])
+    frame_gate.update(active_session_id, signature, payload)
+
+    for student in payload.get("students", []):
+        duplicate = student["message"] == "Presence deja marquee"
+        attendance_marks.inc(result="duplicate" if duplicate else "new")
+    if not result["faces"]:
+        outcome = "no_face"
+    elif not result["detections"]:
+        outcome = "unknown"
+    else:
+        outcome = "recognized"
+    return payload, 200, outcome
 
-    if os.path.exists(temp_path):
-        os.remove(temp_path)
 
-    if not student_id:
-        return jsonify({"status": "error", "message": "Aucun etudiant reconnu"}), 200
-
-    now = datetime.utcnow().isoformat()
-    conn = get_db_connection()
-    student = conn.execute(
-        "SELECT id, first_name, last_name FROM users WHERE id = ? AND role = 'student'",
-        (student_id,),
-    ).fetchone()
-
-    if not student:
-        conn.close()
-        return jsonify({"status": "error", "message": "Etudiant inconnu"}), 200
-
-    existing = conn.execute(
-        "SELECT id FROM attendance_records WHERE session_id = ? AND student_id = ?",
-        (active_session_id, student_id),
-    ).fetchone()
+@app.route("/api/attendance/recognize", methods=["POST"])
+@login_required(role="professor")
+def recognize_attendance():
+    timer = StageTimer()
+    with timer.stage("total"):
+        payload, status, outcome = run_recognition(timer)
+    recognition_requests.inc(outcome=outcome)
+    timer.observe(recognition_stage_seconds)
 
-    if existing:
-        conn.close()
-        return jsonify(
-            {
-                "status": "success",
-                "message": "Presence deja marquee",
-                "student": f"{student['first_name']} {student['last_name']}",
-            }
-        )
+    response = jsonify(payload)
+    response.status_code = status
+    if app.config["SERVER_TIMING"]:
+        response.headers["Server-Timing"] = timer.server_timing()
+    return response
 
-    conn.execute(
-        """
-        INSERT INTO attendance_records (session_id, student_id, status, marked_at)
-        VALUES (?, ?, 'present', ?)
-        """,
-        (active_session_id, student_id, now),
-    )
-    conn.commit()
-    conn.close()
 
-    return jsonify(
-        {
-            "status": "success",
-            "message": "Presence marquee",
-            "student": f"{student['first_name']} {student['last_name']}",
-        }
-    )
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=METRICS_CONTENT_TYPE)
 
 
 @app.route("/api/prof/records")
 @login_required(role="professor")
 def api_prof_records():
-    active_session_id = get_active_session_id()
+    # Newest first, one page at a time: pass X-Next-Cursor back as ?cursor= for
+    # the next page. ?since=<id or marked_at> returns only newer records, oldest
+    # first; pass X-Next-Since back on the next poll. Unchanged polls get a 304.
+    active_session_id = get_active_session_id(session["user_id"])
     if not active_session_id:
         return jsonify([])
 
+    since = request.args.get("since")
+    cursor = request.args.get("cursor", "")
+    limit = request.args.get("limit", RECORDS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, RECORDS_MAX_PAGE_SIZE))
+
     conn = get_db_connection()
-    rows = conn.execute(
-        """
-        SELECT u.first_name, u.last_name, ar.status, ar.marked_at
-        FROM attendance_records ar
-        JOIN users u ON u.id = ar.student_id
-        WHERE ar.session_id = ?
-        ORDER BY ar.marked_at DESC
-        """,
-        (active_session_id,),
-    ).fetchall()
+    # Records are only ever inserted or deleted, so count and last id identify
+    # the session's state; the query string tells pages apart.
+    count, last_id = conn.execute(RECORDS_STATE_QUERY, (active_session_id,)).fetchone()
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:12]
+    etag = f"{active_session_id}-{count}-{last_id}-{query_hash}"
+    if request.if_none_match.contains(etag):
+        conn.close()
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    if since is not None and since.isdigit():
+        query, params = RECORDS_SINCE_ID_QUERY, (active_session_id, int(since))
+    elif since is not None:
+        query, params = RECORDS_SINCE_TIME_QUERY, (active_session_id, since)
+    elif cursor.isdigit():
+        query, params = RECORDS_PAGE_QUERY, (active_session_id, int(cursor))
+    else:
+        query, params = RECORDS_FIRST_PAGE_QUERY, (active_session_id,)
+
+    rows = conn.execute(query, params + (limit + 1,)).fetchall()
     conn.close()
 
-    return jsonify(
-        [
-            {
-                "student": f"{r['first_name']} {r['last_name']}",
-                "status": r["status"],
-                "marked_at": r["marked_at"],
-            }
-            for r in rows
-        ]
+    has_more = len(rows) > limit
+    records = [record_to_json(r) for r in rows[:limit]]
+    response = jsonify(records)
+    if since is not None:
+        response.headers["X-Next-Since"] = str(records[-1]["id"]) if records else since
+    elif has_more:
+        response.headers["X-Next-Cursor"] = str(records[-1]["id"])
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/prof/records/stream")
+@login_required(role="professor")
+def stream_prof_records():
+    active_session_id = get_active_session_id(session["user_id"])
+    if not active_session_id:
+        return Response(status=204)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_id", "0")
+    last_id = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def events(last_id):
+        # Subscribe before the first query so nothing committed in between is lost.
+        # The feed only wakes the stream up; records always come from the
+        # database. SQLite has a single writer, so rows commit in id order and
+        # the last id sent is a safe watermark.
+        subscription = live_feed.subscribe(active_session_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                conn = get_db_connection()
+                records = fetch_records_since(conn, active_session_id, last_id)
+                conn.close()
+                for record in records:
+                    last_id = record["id"]
+                    yield format_event(record)
+
+                # Cleared after waking, before the next query: a notification
+                # arriving during that query wakes the following wait at once.
+                # On timeout the query still picks up rows committed by other
+                # server processes.
+                notified = subscription.wait(RECORD_STREAM_HEARTBEAT)
+                subscription.clear()
+                if not notified and not records:
+                    yield ": keep-alive\n\n"
+        finally:
+            live_feed.unsubscribe(active_session_id, subscription)
+
+    return Response(
+        stream_with_context(events(last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
 init_db()
+if app.config["WARMUP_ON_IMPORT"] and serving_process():
+    start_warm_up()
 
 
 if __name__ == "__main__":
@@ -1,13 +1,17 @@
 import cv2
 import os
-from deepface import DeepFace
-import openpyxl
 import time
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from threading import Thread
+from threading import Event, Thread
 import traceback
 import pygame  # For sound feedback
+from attendance_sink import AttendanceSink
+from face_gallery import FaceGallery, detect_faces, represent_crops, represent_image
+from face_tracker import FaceTracker
+from frame_gate import FrameGate
+from pipeline import DropOldestQueue, StageCounter
 
 # Initialize sound
 pygame.mixer.init()
@@ -19,36 +23,17 @@ def play_sound(file):
     except Exception as e:
         print(f"Error playing sound: {e}")
 
-# Initialize Excel for attendance tracking
-def initialize_excel(filename):
+def export_to_excel():
     try:
-        if not os.path.exists(filename):
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            sheet.title = "Attendance"
-            sheet.append(["Name", "Date", "Time", "Status"])
-            workbook.save(filename)
-            print(f"Excel file created at {filename}")
-        else:
-            print(f"Excel file already exists at {filename}")
+        attendance_sink.export_xlsx(attendance_filename)
+        print(f"Attendance exported to {attendance_filename}")
     except Exception as e:
-        print(f"Error initializing Excel file: {e}")
+        print(f"Error exporting to Excel: {e}")
         traceback.print_exc()
 
-def save_to_excel(filename, row):
-    try:
-        workbook = openpyxl.load_workbook(filename)
-        sheet = workbook["Attendance"]
-        sheet.append(row)
-        workbook.save(filename)
-        print(f"Row saved successfully: {row}")
-    except Exception as e:
-        print(f"Error saving to Excel: {e}")
-        traceback.print_exc()
-
-# Paths for Excel and reference images
+# Attendance rows go to an append-only CSV log; the Excel file is exported from it
 attendance_filename = r"attendance.xlsx"
-initialize_excel(attendance_filename)
+attendance_sink = AttendanceSink(r"attendance_log.csv", legacy_xlsx_path=attendance_filename)
 
 reference_images_path = r"Images"
 if not os.path.exists(reference_images_path):
@@ -67,64 +52,197 @@ except Exception as e:
     print(f"Error loading reference images: {e}")
     traceback.print_exc()
 
+# Embed each reference image once instead of letting DeepFace.find rescan the folder
+reference_names = list(reference_images.keys())
+reference_gallery = FaceGallery()
+try:
+    reference_vectors, reference_rows = [], []
+    for index, name in enumerate(reference_names):
+        embeddings = represent_image(reference_images[name])
+        if embeddings:
+            reference_rows.append(index)
+            reference_vectors.append(embeddings[0])
+    reference_gallery.load(reference_rows, reference_rows, reference_vectors)
+except Exception as e:
+    print(f"Error embedding reference images: {e}")
+    traceback.print_exc()
+
 # Attendance tracking dictionary
 attendance_dict = {}
 
+# Faces keep their identity across frames; only new or stale tracks are re-recognized
+face_tracker = FaceTracker()
+
+# Frames of a static scene reuse the previous recognition result
+frame_gate = FrameGate()
+
+# Recognition works on frames resized to this size
+RECOGNITION_SIZE = (640, 480)
+
+# Tk widgets may only be touched from the main loop; worker threads go through this.
+def set_status(status_label, text, color):
+    root.after(0, lambda: status_label.config(text=text, fg=color))
+
+def record_attendance(name, status_label, attendee_list):
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S").split()
+    attendance_sink.append([name, timestamp[0], timestamp[1], "Present"])
+    play_sound(r"C:\Users\admin\Desktop\FaceRecogAttendance\FeedbackSoundsq")
+
+    def update_ui():
+        attendee_list.insert(tk.END, f"{name} marked present at {timestamp[1]}\n")
+        status_label.config(text=f"Marked attendance for: {name}", fg="green")
+
+    root.after(0, update_ui)
+
+def recognize_frame(resized_frame):
+    new_names = []
+    try:
+        height, width = resized_frame.shape[:2]
+        faces = []
+        for face in detect_faces(resized_frame):
+            area = face["facial_area"]
+            # Without a detection DeepFace returns the whole frame as the face
+            if area["w"] >= width and area["h"] >= height:
+                continue
+            faces.append(face)
+
+        boxes = [
+            (face["facial_area"]["x"], face["facial_area"]["y"], face["facial_area"]["w"], face["facial_area"]["h"])
+            for face in faces
+        ]
+        tracks = face_tracker.update(boxes)
+
+        pending = face_tracker.pending(tracks)
+        if pending:
+            crops = [faces[tracks.index(track)]["crop"] for track in pending]
+            matches = reference_gallery.match(represent_crops(crops))
+            now = time.monotonic()
+            for track, match in zip(pending, matches):
+                track.set_identity(reference_names[match[0]] if match else None, now)
+                if track.identity and track.identity not in attendance_dict:
+                    attendance_dict[track.identity] = True
+                    new_names.append(track.identity)
+
+        overlays = [
+            (track.box, track.identity or "Unknown", (0, 255, 0) if track.identity else (0, 0, 255))
+            for track in tracks
+        ]
+
+    except Exception as e:
+        print(f"Error during face recognition: {e}")
+        traceback.print_exc()
+        overlays = [(None, "Error", (0, 0, 255))]
+
+    return overlays, new_names
+
+def draw_overlays(frame, overlays):
+    # Boxes come from the resized recognition frame; scale them back to the camera frame
+    scale_x = frame.shape[1] / RECOGNITION_SIZE[0]
+    scale_y = frame.shape[0] / RECOGNITION_SIZE[1]
+    for box, text, color in overlays:
+        if box is None:
+            cv2.putText(frame, text, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+            continue
+        x, y, w, h = box
+        top_left = (int(x * scale_x), int(y * scale_y))
+        bottom_right = (int((x + w) * scale_x), int((y + h) * scale_y))
+        cv2.rectangle(frame, top_left, bottom_right, color, 2)
+        cv2.putText(frame, text, (top_left[0], max(top_left[1] - 10, 20)), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+# Pipeline stages: capture -> recognition -> sink (attendance log, sound, attendance list).
+# The preview loop only draws the latest overlays, so it keeps the camera frame rate
+# while recognition runs at its own pace on the newest frame available.
+def capture_stage(cap, stop_event, preview_queue, recognition_queue, counter, status_label):
+    while not stop_event.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            set_status(status_label, "Error: Could not read frame.", "red")
+            stop_event.set()
+            break
+        counter.tick()
+        preview_queue.put(frame)
+        recognition_queue.put(frame)
+
+def recognition_stage(stop_event, recognition_queue, sink_queue, overlay_state, counter):
+    while not stop_event.is_set():
+        frame = recognition_queue.get(timeout=0.5)
+        if frame is None:
+            continue
+        resized_frame = cv2.resize(frame, RECOGNITION_SIZE)
+
+        # Skip recognition while the scene has not changed since the last inference
+        signature, overlays = frame_gate.check("camera", resized_frame)
+        if overlays is None:
+            overlays, new_names = recognize_frame(resized_frame)
+            frame_gate.update("camera", signature, overlays)
+            for name in new_names:
+                sink_queue.put(name)
+
+        overlay_state["overlays"] = overlays
+        counter.tick()
+
+def sink_stage(stop_event, sink_queue, counter, status_label, attendee_list):
+    # Drain what is left after stop so no recognised student is lost
+    while not (stop_event.is_set() and sink_queue.empty()):
+        try:
+            name = sink_queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        record_attendance(name, status_label, attendee_list)
+        counter.tick()
+
 # Start attendance function
 def start_attendance(status_label, attendee_list):
     attendance_dict.clear()
+    frame_gate.forget("camera")
+    face_tracker.reset()
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
-        status_label.config(text="Error: Could not access the camera.", fg="red")
+        set_status(status_label, "Error: Could not access the camera.", "red")
         return
 
-    status_label.config(text="Camera opened. Starting attendance...", fg="blue")
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            status_label.config(text="Error: Could not read frame.", fg="red")
-            break
-
-        resized_frame = cv2.resize(frame, (640, 480))
-
-        try:
-            results = DeepFace.find(
-                img_path=resized_frame,
-                db_path=reference_images_path,
-                enforce_detection=False,
-                detector_backend="opencv",
-            )
-
-            if len(results) > 0:
-                match = results[0].iloc[0]
-                full_path = match["identity"]
-                name = os.path.basename(full_path).split(".")[0].replace("_", " ")
-
-                if name not in attendance_dict:
-                    attendance_dict[name] = True
-                    timestamp = time.strftime("%Y-%m-%d %H:%M:%S").split()
-                    save_to_excel(attendance_filename, [name, timestamp[0], timestamp[1], "Present"])
-                    play_sound(r"C:\Users\admin\Desktop\FaceRecogAttendance\FeedbackSoundsq")
-                    attendee_list.insert(tk.END, f"{name} marked present at {timestamp[1]}\n")
-                    status_label.config(text=f"Marked attendance for: {name}", fg="green")
-
-                cv2.putText(frame, name, (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            else:
-                cv2.putText(frame, "Unknown", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-        except Exception as e:
-            print(f"Error during face recognition: {e}")
-            traceback.print_exc()
-            cv2.putText(frame, "Error", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    set_status(status_label, "Camera opened. Starting attendance...", "blue")
+
+    stop_event = Event()
+    preview_queue = DropOldestQueue(1)
+    recognition_queue = DropOldestQueue(2)
+    sink_queue = queue.Queue()
+    overlay_state = {"overlays": []}
+    counters = [StageCounter("camera"), StageCounter("recognition"), StageCounter("sink"), StageCounter("preview")]
+    capture_counter, recognition_counter, sink_counter, preview_counter = counters
+
+    stages = [
+        Thread(target=capture_stage, args=(cap, stop_event, preview_queue, recognition_queue, capture_counter, status_label)),
+        Thread(target=recognition_stage, args=(stop_event, recognition_queue, sink_queue, overlay_state, recognition_counter)),
+        Thread(target=sink_stage, args=(stop_event, sink_queue, sink_counter, status_label, attendee_list)),
+    ]
+    for stage in stages:
+        stage.daemon = True
+        stage.start()
+
+    while not stop_event.is_set():
+        frame = preview_queue.get(timeout=0.5)
+        if frame is None:
+            continue
+
+        draw_overlays(frame, overlay_state["overlays"])
+        preview_counter.tick()
+        stats = " | ".join(str(counter) for counter in counters)
+        cv2.putText(frame, stats, (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
 
         cv2.imshow("Face Recognition Attendance", frame)
 
         if cv2.waitKey(1) & 0xFF == ord("q"):  # Press 'q' to exit
-            break
+            stop_event.set()
 
+    for stage in stages:
+        stage.join()
     cap.release()
     cv2.destroyAllWindows()
-    status_label.config(text="Attendance process completed.", fg="blue")
+    print("Pipeline totals: " + ", ".join(f"{counter.name}={counter.total}" for counter in counters))
+    print(f"Frames dropped before recognition: {recognition_queue.dropped}")
+    export_to_excel()
+    set_status(status_label, "Attendance process completed.", "blue")
 
 def start_attendance_thread(status_label, attendee_list):
     attendance_thread = Thread(target=start_attendance, args=(status_label, attendee_list))
@@ -171,8 +289,11 @@ button_frame.pack(pady=20)
 start_button = ttk.Button(button_frame, text="Start Attendance", command=lambda: start_attendance_thread(status_label, attendee_list))
 start_button.grid(row=0, column=0, padx=10, pady=10)
 
+export_button = ttk.Button(button_frame, text="Export Excel", command=export_to_excel)
+export_button.grid(row=0, column=1, padx=10, pady=10)
+
 exit_button = ttk.Button(button_frame, text="Exit", command=root.quit)
-exit_button.grid(row=0, column=1, padx=10, pady=10)
+exit_button.grid(row=0, column=2, padx=10, pady=10)
 
 # Footer
 footer_label = tk.Label(
@@ -0,0 +1,96 @@
+import atexit
+import csv
+import os
+import threading
+
+import openpyxl
+
+HEADER = ["Name", "Date", "Time", "Status"]
+DEFAULT_FLUSH_INTERVAL = 2.0
+DEFAULT_MAX_BUFFER = 50
+
+
+def read_xlsx_rows(xlsx_path):
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True)
+    try:
+        sheet = workbook["Attendance"]
+        return [list(row) for row in sheet.iter_rows(min_row=2, values_only=True) if any(row)]
+    finally:
+        workbook.close()
+
+
+class AttendanceSink:
+    # Buffers attendance rows and appends them to a CSV log in batches, so a
+    # mark costs the same whether the log holds ten rows or ten thousand.
+    # The Excel file is produced on demand by export_xlsx().
+
+    def __init__(
+        self,
+        log_path,
+        legacy_xlsx_path=None,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        max_buffer=DEFAULT_MAX_BUFFER,
+    ):
+        self.log_path = log_path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        if not os.path.exists(log_path):
+            with open(log_path, "w", newline="", encoding="utf-8") as log_file:
+                writer = csv.writer(log_file)
+                writer.writerow(HEADER)
+                # Carry over rows written by the old load/append/save Excel flow
+                if legacy_xlsx_path and os.path.exists(legacy_xlsx_path):
+                    writer.writerows(read_xlsx_rows(legacy_xlsx_path))
+
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def append(self, row):
+        self.append_many([row])
+
+    def append_many(self, rows):
+        with self._lock:
+            self._buffer.extend(rows)
+            should_flush = len(self._buffer) >= self.max_buffer
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            try:
+                with open(self.log_path, "a", newline="", encoding="utf-8") as log_file:
+                    csv.writer(log_file).writerows(rows)
+            except OSError:
+                # Keep the rows for the next flush (e.g. the file is open in Excel).
+                self._buffer[:0] = rows
+                raise
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+
+    def export_xlsx(self, xlsx_path):
+        self.flush()
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Attendance")
+        with open(self.log_path, newline="", encoding="utf-8") as log_file:
+            for row in csv.reader(log_file):
+                sheet.append(row)
+        workbook.save(xlsx_path)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error flushing attendance log: {e}")
@@ -0,0 +1,435 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+if platform.system() == "Windows":
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t)
+            for name in (
+                "PeakWorkingSetSize", "WorkingSetSize",
+                "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                "PagefileUsage", "PeakPagefileUsage",
+            )
+        ]
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SAMPLE_DIR = os.path.join(BASE_DIR, "Images")
+EMBEDDING_DIMENSIONS = 4096
+# Spread of a student's captures around their identity, relative to its unit norm.
+CAPTURE_NOISE = 0.5
+UNKNOWN_QUERY_RATIO = 0.2
+# Where the kernel cannot reset the peak, RSS is polled this often instead.
+RSS_SAMPLE_INTERVAL = 0.005
+# Context the dashboard keeps around each face it crops (FACE_MARGIN in prof_dashboard.html).
+BROWSER_FACE_MARGIN = 0.2
+
+
+def rss_mb():
+    # Current resident set size.
+    if platform.system() == "Windows":
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+        )
+        return counters.WorkingSetSize / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:  # macOS
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS. Not
+    # ru_maxrss, a lifetime peak that would charge every scenario with the
+    # largest one run before it.
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def kernel_peak_rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+class PeakSampler:
+    # Fallback for Windows: polls the current RSS, so very short spikes can be missed.
+
+    def __init__(self):
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def measure_rss(scenario):
+    # Runs scenario() and adds its peak RSS and how far that peak rose above
+    # the RSS at its start.
+    before = rss_mb()
+    if before is None:  # macOS
+        peak = None
+        report = scenario()
+    elif reset_peak_rss():
+        report = scenario()
+        peak = kernel_peak_rss_mb()
+    else:
+        with PeakSampler() as sampler:
+            report = scenario()
+        peak = sampler.peak
+    report["peak_rss_mb"] = peak
+    report["peak_growth_mb"] = peak - before if peak is not None else None
+    return report
+
+
+def format_mb(value, spec=".1f"):
+    return "n/a" if value is None else format(value, spec)
+
+
+def summarize(latencies, items=None):
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = float(latencies.sum())
+    items = len(latencies) if items is None else items
+    return {
+        "count": len(latencies),
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        "p99_ms": 1000 * float(np.percentile(latencies, 99)),
+        "mean_ms": 1000 * float(latencies.mean()),
+        "throughput_per_s": items / total if total else None,
+    }
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+class EmbeddingSource:
+    # Random unit vectors around one random identity per student: exercises
+    # storage, gallery build and matching without running any model.
+
+    def __init__(self, captures, seed):
+        self.captures = captures
+        self.rng = np.random.default_rng(seed)
+        self.identities = {}
+
+    def _identity(self, student_id):
+        if student_id not in self.identities:
+            self.identities[student_id] = self.rng.standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+        return self.identities[student_id]
+
+    def _around(self, identity):
+        noise = self.rng.standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+        vector = identity / np.linalg.norm(identity) + CAPTURE_NOISE * noise / np.sqrt(EMBEDDING_DIMENSIONS)
+        return vector / np.linalg.norm(vector)
+
+    def student_vectors(self, student_id):
+        identity = self._identity(student_id)
+        return [self._around(identity) for _ in range(self.captures)]
+
+    def queries(self, student_ids, count):
+        queries = []
+        for _ in range(count):
+            if self.rng.random() < UNKNOWN_QUERY_RATIO:
+                queries.append((None, self._around(self.rng.standard_normal(EMBEDDING_DIMENSIONS))))
+            else:
+                student_id = int(self.rng.choice(student_ids))
+                queries.append((student_id, self._around(self._identity(student_id))))
+        return queries
+
+
+class ImageSource:
+    # Augmented copies of the sample photos in Images/, run through the real
+    # detector and model. Students beyond the number of samples reuse them
+    # with other augmentations, so accuracy numbers are not meaningful here.
+
+    def __init__(self, app, captures, seed):
+        self.app = app
+        self.captures = captures
+        self.rng = np.random.default_rng(seed)
+        self.samples = []
+        for name in sorted(os.listdir(SAMPLE_DIR)):
+            img = cv2.imread(os.path.join(SAMPLE_DIR, name))
+            if img is not None:
+                self.samples.append(img)
+        if not self.samples:
+            raise SystemExit(f"No readable images in {SAMPLE_DIR}")
+
+    def augment(self, img):
+        if self.rng.random() < 0.5:
+            img = cv2.flip(img, 1)
+        height, width = img.shape[:2]
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), self.rng.uniform(-10, 10), 1.0)
+        img = cv2.warpAffine(img, rotation, (width, height), borderMode=cv2.BORDER_REFLECT)
+        img = cv2.convertScaleAbs(img, alpha=self.rng.uniform(0.8, 1.2), beta=self.rng.uniform(-20, 20))
+        noise = self.rng.normal(0, 4, img.shape)
+        return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+    def _sample(self, student_id):
+        return self.samples[student_id % len(self.samples)]
+
+    def student_vectors(self, student_id):
+        vectors = []
+        for _ in range(self.captures):
+            embeddings = self.app.represent_image(self.augment(self._sample(student_id)))
+            if embeddings:
+                vectors.append(embeddings[0])
+        return vectors
+
+    def queries(self, student_ids, count):
+        return [
+            (student_id, self.augment(self._sample(student_id)))
+            for student_id in (int(s) for s in self.rng.choice(student_ids, count))
+        ]
+
+
+def add_students(app, source, count):
+    # Same rows the register route writes, minus saving the uploads.
+    conn = app.get_db_connection()
+    student_ids, image_ids, vectors = [], [], []
+    for _ in range(count):
+        user_id = conn.execute(
+            """
+            INSERT INTO users (first_name, last_name, email, password_hash, role)
+            VALUES ('Bench', 'Student', ?, 'x', 'student')
+            """,
+            (f"bench-{time.perf_counter_ns()}@example.com",),
+        ).lastrowid
+        for vector in source.student_vectors(user_id):
+            image_ids.append(
+                conn.execute(
+                    "INSERT INTO student_images (user_id, image_path) VALUES (?, ?)",
+                    (user_id, f"synthetic/{user_id}.jpg"),
+                ).lastrowid
+            )
+            student_ids.append(user_id)
+            vectors.append(vector)
+    app.store_embeddings(conn, image_ids, vectors)
+    conn.commit()
+    conn.close()
+    app.gallery.add(image_ids, student_ids, vectors)
+    return student_ids
+
+
+def all_student_ids(app):
+    conn = app.get_db_connection()
+    ids = [row["id"] for row in conn.execute("SELECT id FROM users WHERE role = 'student'")]
+    conn.close()
+    return ids
+
+
+def bench_cold_start(app, repeat):
+    latencies = [timed(app.load_gallery)[0] for _ in range(repeat)]
+    return summarize(latencies)
+
+
+def browser_crops(app, img):
+    # Square crops padded with black around each face, as the dashboard
+    # uploads them; the server detector stands in for the browser's.
+    crops = []
+    for face in app.detect_faces(img):
+        if face["confidence"] <= 0:
+            continue
+        area = face["facial_area"]
+        side = round(max(area["w"], area["h"]) * (1 + 2 * BROWSER_FACE_MARGIN))
+        left = round(area["x"] + area["w"] / 2 - side / 2)
+        top = round(area["y"] + area["h"] / 2 - side / 2)
+        padded = cv2.copyMakeBorder(img, side, side, side, side, cv2.BORDER_CONSTANT, value=0)
+        square = padded[top + side:top + 2 * side, left + side:left + 2 * side]
+        crops.append(
+            {
+                "crop": cv2.resize(square, (app.FACE_CROP_SIZE, app.FACE_CROP_SIZE), interpolation=cv2.INTER_AREA),
+                "region": {"x": left, "y": top, "w": side, "h": side},
+            }
+        )
+    return crops
+
+
+def bench_warm_match(app, mode, queries):
+    # mode "crops" matches the dashboard's face crops instead of the full
+    # frames, to compare its accuracy with full-frame recognition.
+    if mode == "crops":
+        queries = [(expected, browser_crops(app, query)) for expected, query in queries]
+    latencies, correct = [], 0
+    for expected, query in queries:
+        if mode == "embeddings":
+            seconds, matches = timed(app.gallery.match, query[np.newaxis, :])
+            found = matches[0][0] if matches[0] else None
+            correct += found == expected
+        else:
+            job = {"crops": query} if mode == "crops" else {"image": query}
+            seconds, results = timed(app.recognize_batch, [{**job, "candidate_ids": None}])
+            correct += any(d["student_id"] == expected for d in results[0]["detections"])
+        latencies.append(seconds)
+    report = summarize(latencies)
+    report["accuracy"] = correct / len(queries)
+    return report
+
+
+def bench_registration(app, source, count):
+    latencies = [timed(add_students, app, source, 1)[0] for _ in range(count)]
+    return summarize(latencies)
+
+
+def bench_session_close(app, repeat, present_ratio, seed):
+    rng = np.random.default_rng(seed)
+    student_ids = all_student_ids(app)
+    latencies = []
+    for _ in range(repeat):
+        conn = app.get_db_connection()
+        session_id = conn.execute(
+            "INSERT INTO sessions (professor_id, start_time, is_active) VALUES (?, ?, 1)",
+            (professor_id(app), time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ).lastrowid
+        conn.commit()
+        present = rng.choice(student_ids, int(len(student_ids) * present_ratio), replace=False)
+        # Chunks keep each IN (...) under SQLite's bound-parameter limit.
+        for start in range(0, len(present), 500):
+            app.mark_students_present(
+                conn,
+                session_id,
+                [{"student_id": int(s), "facial_area": {}} for s in present[start:start + 500]],
+            )
+        conn.close()
+        latencies.append(timed(app.close_session_and_mark_absent, session_id)[0])
+    report = summarize(latencies, items=repeat * len(student_ids))
+    report["throughput_unit"] = "students/s"
+    return report
+
+
+def professor_id(app):
+    conn = app.get_db_connection()
+    row = conn.execute("SELECT id FROM users WHERE role = 'professor' LIMIT 1").fetchone()
+    if row is None:
+        row_id = conn.execute(
+            """
+            INSERT INTO users (first_name, last_name, email, password_hash, role)
+            VALUES ('Bench', 'Professor', 'bench-professor@example.com', 'x', 'professor')
+            """
+        ).lastrowid
+        conn.commit()
+    else:
+        row_id = row["id"]
+    conn.close()
+    return row_id
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="attendance-bench-")
+    os.environ["ATTENDANCE_DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["ATTENDANCE_UPLOAD_DIR"] = os.path.join(workdir, "Images")
+    os.environ["WARMUP_ON_IMPORT"] = "0"
+
+    # Imported late so the environment above points it at the scratch database.
+    import app
+
+    results = []
+    if args.mode == "images":
+        report = measure_rss(lambda: summarize([timed(app.warmup_models)[0]]))
+        results.append({"scenario": "model_load", "students": 0, **report})
+        source = ImageSource(app, args.captures, args.seed)
+    else:
+        source = EmbeddingSource(args.captures, args.seed)
+
+    enrolled = 0
+    for students in sorted(args.students):
+        add_students(app, source, students - enrolled)
+        enrolled = students
+        print(f"Gallery: {students} students x {args.captures} captures ({len(app.gallery)} embeddings)")
+
+        queries = source.queries(all_student_ids(app), args.queries)
+        scenarios = {
+            "cold_start": lambda: bench_cold_start(app, args.repeat),
+            "warm_match": lambda: bench_warm_match(app, args.mode, queries),
+        }
+        if args.mode == "images":
+            # Same queries as the dashboard's face crops: accuracy must match warm_match.
+            scenarios["warm_match_crops"] = lambda: bench_warm_match(app, "crops", queries)
+        scenarios["registration"] = lambda: bench_registration(app, source, args.registrations)
+        scenarios["session_close"] = lambda: bench_session_close(app, args.repeat, args.present_ratio, args.seed)
+        for name, scenario in scenarios.items():
+            report = {"scenario": name, "students": students, **measure_rss(scenario)}
+            results.append(report)
+            print(
+                f"  {name}: p50 {report['p50_ms']:.2f} ms, p95 {report['p95_ms']:.2f} ms, "
+                f"p99 {report['p99_ms']:.2f} ms, peak RSS {format_mb(report['peak_rss_mb'])} MB "
+                f"({format_mb(report['peak_growth_mb'], '+.1f')} MB)"
+                + (f", accuracy {report['accuracy']:.1%}" if "accuracy" in report else "")
+            )
+        # Registrations grew the gallery; keep the next size exact.
+        enrolled += args.registrations
+
+    app.db_pool.close_all()
+    return {
+        "config": {
+            "mode": args.mode,
+            "captures": args.captures,
+            "queries": args.queries,
+            "repeat": args.repeat,
+            "registrations": args.registrations,
+            "present_ratio": args.present_ratio,
+            "seed": args.seed,
+            "ann_min_gallery_size": app.ANN_MIN_GALLERY_SIZE,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recognition latency and memory vs number of students")
+    parser.add_argument("--mode", choices=["embeddings", "images"], default="embeddings",
+                        help="random embeddings (matching only) or augmented Images/ samples (full pipeline)")
+    parser.add_argument("--students", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--captures", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--registrations", type=int, default=20)
+    parser.add_argument("--present-ratio", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2, sort_keys=True)
+        output_file.write("\n")
+    print(f"Results written to {args.output}")
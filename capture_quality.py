@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+
+from face_gallery import detect_faces, l2_normalize, represent_crops
+
+# Variance of the Laplacian of the grey crop; lower is motion or focus blur.
+MIN_BLUR_VARIANCE = 40.0
+MIN_BRIGHTNESS = 40.0
+MAX_BRIGHTNESS = 220.0
+# Side of the detected face in the original capture, in pixels.
+MIN_FACE_SIZE = 60
+# Cosine distance under which two captures count as the same pose.
+DUPLICATE_DISTANCE = 0.05
+
+
+def blur_variance(crop):
+    grey = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    return float(cv2.Laplacian(grey, cv2.CV_64F).var())
+
+
+def brightness(crop):
+    return float(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY).mean())
+
+
+def assess(face):
+    # face as returned by detect_faces(). Returns (score, reason); reason is
+    # None for a usable capture and names the first failed check otherwise.
+    area = face["facial_area"]
+    size = min(area["w"], area["h"])
+    blur = blur_variance(face["crop"])
+    light = brightness(face["crop"])
+
+    if size < MIN_FACE_SIZE:
+        return 0.0, "visage trop petit"
+    if blur < MIN_BLUR_VARIANCE:
+        return 0.0, "image floue"
+    if not MIN_BRIGHTNESS <= light <= MAX_BRIGHTNESS:
+        return 0.0, "eclairage insuffisant"
+
+    # Each factor saturates at 1 once comfortably past its threshold.
+    sharpness = min(blur / (4 * MIN_BLUR_VARIANCE), 1.0)
+    scale = min(size / (3 * MIN_FACE_SIZE), 1.0)
+    exposure = 1.0 - abs(light - 128.0) / 128.0
+    confidence = min(max(face.get("confidence", 0.0), 0.0), 1.0)
+    return sharpness * scale * exposure * confidence, None
+
+
+def select_diverse(embeddings, scores, k):
+    # Greedy: best score first, skipping captures that repeat a pose already
+    # kept. Returns the indices of at most k captures.
+    embeddings = l2_normalize(embeddings)
+    kept = []
+    for index in np.argsort(scores)[::-1]:
+        if len(kept) == k:
+            break
+        if kept:
+            distances = 1.0 - embeddings[kept] @ embeddings[index]
+            if distances.min() < DUPLICATE_DISTANCE:
+                continue
+        kept.append(int(index))
+    return kept
+
+
+def centroid(embeddings, weights=None):
+    # Quality-weighted mean identity vector for the compact one-embedding mode.
+    embeddings = l2_normalize(embeddings)
+    return l2_normalize(np.average(embeddings, axis=0, weights=weights))[0]
+
+
+def embed_captures(images, keep, use_centroid=False):
+    # Scores every decoded capture, embeds the usable faces in one pass and
+    # keeps the best diverse ones (or their centroid). Returns (kept, rejected):
+    # kept is a list of (capture index, embedding), rejected the reasons the
+    # other captures were dropped.
+    crops, scores, indices, rejected = [], [], [], []
+    for index, img in enumerate(images):
+        # Without a detected face, extract_faces returns the whole image at confidence 0.
+        faces = [face for face in detect_faces(img) if face["confidence"] > 0]
+        if not faces:
+            rejected.append("aucun visage")
+            continue
+        face = max(faces, key=lambda f: f["facial_area"]["w"] * f["facial_area"]["h"])
+        score, reason = assess(face)
+        if reason:
+            rejected.append(reason)
+            continue
+        crops.append(face["crop"])
+        scores.append(score)
+        indices.append(index)
+
+    if not crops:
+        return [], rejected
+
+    vectors = represent_crops(crops)
+    if use_centroid:
+        # One row: the best capture's image carries the averaged embedding.
+        best = int(np.argmax(scores))
+        return [(indices[best], centroid(vectors, weights=scores))], rejected
+    return [(indices[i], vectors[i]) for i in select_diverse(vectors, scores, keep)], rejected
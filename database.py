@@ -0,0 +1,106 @@
+import queue
+import sqlite3
+
+DEFAULT_POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+# Prepared statements kept per connection (sqlite3 default is 128).
+CACHED_STATEMENTS = 256
+
+PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing it, so
+    # existing "conn = get_db_connection() ... conn.close()" code reuses
+    # connections and their prepared-statement cache unchanged.
+
+    pool = None
+    idle = False
+
+    def close(self):
+        # Closing twice must not put the same connection in the pool twice.
+        if self.idle:
+            return
+        if self.in_transaction:
+            self.rollback()
+        if self.pool is None or not self.pool.release(self):
+            self.dispose()
+
+    def dispose(self):
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._wal_enabled = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            factory=PooledConnection,
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.pool = self
+        if not self._wal_enabled:
+            # WAL lets dashboard reads proceed while recognition writes; it is
+            # persistent, so once per process is enough.
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._wal_enabled = True
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+        conn.idle = False
+        return conn
+
+    def release(self, conn):
+        conn.idle = True
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.idle = False
+            return False
+        return True
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().dispose()
+            except queue.Empty:
+                return
+
+
+def apply_migrations(conn, migrations):
+    # migrations[n] upgrades a database whose PRAGMA user_version is n.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(migrations[version:], start=version + 1):
+        conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;")
+    return len(migrations)
+
+
+def explain_query_plan(conn, sql, params=()):
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def plan_uses_index(plan):
+    # A bare "SCAN <table>" is a full table scan; scans and searches that go
+    # through an index (or the rowid) are fine.
+    return not any(
+        step.startswith("SCAN") and "INDEX" not in step for step in plan
+    )
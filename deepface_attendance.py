@@ -1,29 +1,12 @@
 import cv2
 import os
 from deepface import DeepFace
-import openpyxl
 import time
+from attendance_sink import AttendanceSink
 
-# Initialize Excel for attendance tracking
-def initialize_excel(filename):
-    try:
-        workbook = openpyxl.load_workbook(filename)
-    except FileNotFoundError:
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Attendance"
-        sheet.append(["Name", "Date", "Time", "Status"])
-        workbook.save(filename)
-
-def save_to_excel(filename, row):
-    workbook = openpyxl.load_workbook(filename)
-    sheet = workbook["Attendance"]
-    sheet.append(row)
-    workbook.save(filename)
-
-# Initialize attendance Excel file
+# Attendance rows go to an append-only CSV log; the Excel file is exported on exit
 attendance_filename = "attendance.xlsx"
-initialize_excel(attendance_filename)
+attendance_sink = AttendanceSink("attendance_log.csv", legacy_xlsx_path=attendance_filename)
 
 # Path to store the images for reference
 reference_images_path = r"C:\Users\admin\Desktop\FaceRecogAttendance\Images"
@@ -73,7 +56,7 @@ while True:
             if name not in attendance_dict:
                 attendance_dict[name] = True
                 timestamp = time.strftime("%Y-%m-%d %H:%M:%S").split()
-                save_to_excel(attendance_filename, [name, timestamp[0], timestamp[1], "Present"])
+                attendance_sink.append([name, timestamp[0], timestamp[1], "Present"])
                 print(f"Marked attendance for: {name}")
 
             # Display name on the frame
@@ -92,3 +75,4 @@ while True:
 
 cap.release()
 cv2.destroyAllWindows()
+attendance_sink.export_xlsx(attendance_filename)
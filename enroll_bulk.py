@@ -0,0 +1,220 @@
+import argparse
+import csv
+import multiprocessing
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PASSWORDS_OUT = "enrolled_passwords.csv"
+
+
+def students_from_csv(csv_path):
+    # Columns: first_name, last_name, email, photos (";"-separated paths,
+    # relative to the CSV file) and optionally password.
+    base_dir = os.path.dirname(os.path.abspath(csv_path))
+    with open(csv_path, newline="", encoding="utf-8-sig") as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield {
+                "first_name": row["first_name"].strip(),
+                "last_name": row["last_name"].strip(),
+                "email": row["email"].strip().lower(),
+                "password": (row.get("password") or "").strip(),
+                "photos": [
+                    os.path.join(base_dir, path.strip())
+                    for path in row["photos"].split(";")
+                    if path.strip()
+                ],
+            }
+
+
+def students_from_directory(directory):
+    # One sub-directory per student, named after their email; the name is
+    # taken from the part before "@" ("first.last" or "first_last").
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_dir() or "@" not in entry.name:
+            continue
+        email = entry.name.strip().lower()
+        first, _, last = email.split("@")[0].replace("_", ".").partition(".")
+        yield {
+            "first_name": first.capitalize(),
+            "last_name": last.replace(".", " ").title() or first.capitalize(),
+            "email": email,
+            "password": "",
+            "photos": sorted(
+                os.path.join(entry.path, name)
+                for name in os.listdir(entry.path)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            ),
+        }
+
+
+def init_worker():
+    # One inference thread per process: the pool already uses every core.
+    for name in ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS", "OMP_NUM_THREADS"):
+        os.environ.setdefault(name, "1")
+    from face_gallery import warmup_models
+
+    warmup_models()
+
+
+def embed_student(task):
+    # Runs in a pool process: no database, no Flask, only the models.
+    import cv2
+    from werkzeug.security import generate_password_hash
+
+    import capture_quality
+
+    student, keep, use_centroid = task
+    images, paths = [], []
+    for path in student["photos"]:
+        img = cv2.imread(path)
+        if img is not None:
+            images.append(img)
+            paths.append(path)
+
+    kept, rejected = capture_quality.embed_captures(images, keep, use_centroid)
+    # Students without a password in the CSV each get their own random one.
+    generated = None if student["password"] else secrets.token_urlsafe(12)
+    return {
+        "student": student,
+        "generated_password": generated,
+        "password_hash": generate_password_hash(student["password"] or generated),
+        "captures": [(paths[i], vector) for i, vector in kept],
+        "rejected": rejected,
+    }
+
+
+def existing_emails(app):
+    conn = app.get_db_connection()
+    emails = {row["email"] for row in conn.execute("SELECT email FROM users")}
+    conn.close()
+    return emails
+
+
+def write_batch(app, results):
+    # One transaction for the whole batch; on failure nothing of it remains.
+    conn = app.get_db_connection()
+    saved_paths = []
+    try:
+        for result in results:
+            student = result["student"]
+            user_id = conn.execute(
+                """
+                INSERT INTO users (first_name, last_name, email, password_hash, role)
+                VALUES (?, ?, ?, ?, 'student')
+                """,
+                (student["first_name"], student["last_name"], student["email"], result["password_hash"]),
+            ).lastrowid
+            captures = []
+            for index, (path, vector) in enumerate(result["captures"], start=1):
+                with open(path, "rb") as image_file:
+                    captures.append((f"bulk{index}", image_file.read(), vector))
+            _, paths = app.store_student_captures(conn, user_id, captures)
+            saved_paths.extend(paths)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        app.remove_files(saved_paths)
+        raise
+    finally:
+        conn.close()
+
+
+def record_passwords(path, results):
+    # Appended before each batch commits, so a crash in between cannot leave
+    # students whose password nobody knows. If the batch then fails, the
+    # rerun appends new pairs: the last line for an email is the valid one.
+    # Readable by the owner only.
+    pairs = [
+        (result["student"]["email"], result["generated_password"])
+        for result in results
+        if result["generated_password"]
+    ]
+    if not pairs:
+        return 0
+    new_file = not os.path.exists(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    with open(fd, "a", newline="", encoding="utf-8") as passwords_file:
+        writer = csv.writer(passwords_file)
+        if new_file:
+            writer.writerow(["email", "password"])
+        writer.writerows(pairs)
+    return len(pairs)
+
+
+def run(args):
+    # Imported here so --help works without the models or the database.
+    import app
+
+    source = students_from_csv(args.csv) if args.csv else students_from_directory(args.directory)
+    done = existing_emails(app)
+    students = []
+    for student in source:
+        # Resume: whoever is already in the database was imported by an earlier run.
+        if student["email"] in done:
+            continue
+        done.add(student["email"])
+        students.append(student)
+
+    total = len(students)
+    if not total:
+        print("Nothing to import.")
+        return 0
+    print(f"Importing {total} students with {args.workers} processes")
+
+    tasks = ((student, args.keep, args.centroid) for student in students)
+    started = time.perf_counter()
+    imported, generated, failed, batch = 0, 0, [], []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.workers, mp_context=context, initializer=init_worker) as pool:
+        for processed, result in enumerate(pool.map(embed_student, tasks, chunksize=4), start=1):
+            if result["captures"]:
+                batch.append(result)
+            else:
+                reasons = ", ".join(sorted(set(result["rejected"]))) or "aucune image lisible"
+                failed.append((result["student"]["email"], reasons))
+
+            if len(batch) >= args.batch_size or processed == total:
+                if batch:
+                    generated += record_passwords(args.passwords_out, batch)
+                    write_batch(app, batch)
+                    imported += len(batch)
+                    batch = []
+                elapsed = time.perf_counter() - started
+                print(
+                    f"{processed}/{total} processed, {imported} imported, {len(failed)} failed "
+                    f"({processed / elapsed:.1f} students/s)",
+                    flush=True,
+                )
+
+    for email, reasons in failed:
+        print(f"Skipped {email}: {reasons}")
+    if generated:
+        print(f"{generated} generated passwords written to {args.passwords_out}; hand them out, then delete it.")
+    print("Running servers load the new faces on their next recognition request.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enroll many students at once from photos on disk")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="CSV with first_name, last_name, email, photos[, password]")
+    source.add_argument("--directory", help="one sub-directory of photos per student, named after the email")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="students written per transaction")
+    parser.add_argument("--keep", type=int, default=int(os.environ.get("ENROLLMENT_KEEP_CAPTURES", 3)),
+                        help="captures kept per student")
+    parser.add_argument("--centroid", action="store_true",
+                        default=os.environ.get("ENROLLMENT_CENTROID", "0") == "1",
+                        help="store one averaged embedding per student")
+    parser.add_argument("--passwords-out", default=DEFAULT_PASSWORDS_OUT,
+                        help="CSV receiving email,password of students given a generated password")
+    args = parser.parse_args()
+
+    # The importer warms up its own workers; the app must not load the models too.
+    os.environ["WARMUP_ON_IMPORT"] = "0"
+    raise SystemExit(run(args))
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 2.0
+# A job still "running" after this long belongs to a worker that died.
+DEFAULT_STALE_SECONDS = 600
+
+NEXT_JOB_QUERY = """
+    SELECT id, user_id, captures FROM enrollment_jobs
+    WHERE status = 'pending'
+    ORDER BY id LIMIT 1
+"""
+
+LATEST_JOB_QUERY = """
+    SELECT id, status, images, error, created_at, started_at, finished_at
+    FROM enrollment_jobs
+    WHERE user_id = ?
+    ORDER BY id DESC LIMIT 1
+"""
+
+
+def enqueue(conn, user_id, captures):
+    # Runs in the caller's transaction, so the user and their job commit together.
+    return conn.execute(
+        "INSERT INTO enrollment_jobs (user_id, captures) VALUES (?, ?)",
+        (user_id, json.dumps(captures)),
+    ).lastrowid
+
+
+def latest_job(conn, user_id):
+    return conn.execute(LATEST_JOB_QUERY, (user_id,)).fetchone()
+
+
+def job_to_json(job):
+    if job is None:
+        return {"status": None}
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "images": job["images"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "matchable": job["status"] == "done" and job["images"] > 0,
+    }
+
+
+class EnrollmentWorker:
+    # Background thread draining the enrollment_jobs table. Jobs are claimed
+    # under BEGIN IMMEDIATE, so several server processes can each run a
+    # worker without processing the same job twice. process_job(job) returns
+    # the number of images stored; an exception marks the job failed.
+
+    def __init__(
+        self,
+        get_connection,
+        process_job,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        stale_seconds=DEFAULT_STALE_SECONDS,
+    ):
+        self.get_connection = get_connection
+        self.process_job = process_job
+        self.poll_interval = poll_interval
+        self.stale_seconds = stale_seconds
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="enrollment", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def _requeue_stale(self):
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.stale_seconds)).isoformat()
+        conn = self.get_connection()
+        with conn:
+            conn.execute(
+                """
+                UPDATE enrollment_jobs SET status = 'pending', started_at = NULL
+                WHERE status = 'running' AND started_at < ?
+                """,
+                (cutoff,),
+            )
+        conn.close()
+
+    def _claim(self):
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute(NEXT_JOB_QUERY).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE enrollment_jobs SET status = 'running', started_at = ? WHERE id = ?",
+                    (datetime.utcnow().isoformat(), job["id"]),
+                )
+            conn.commit()
+            return job
+        finally:
+            conn.close()
+
+    def _finish(self, job_id, status, images=0, error=None):
+        # Retried until it sticks: a "database is locked" during a bulk import
+        # must not leave the job running, and requeuing a job whose captures
+        # are already stored would store them twice.
+        while True:
+            try:
+                conn = self.get_connection()
+                try:
+                    with conn:
+                        # The captures are only needed until they are processed.
+                        conn.execute(
+                            """
+                            UPDATE enrollment_jobs
+                            SET status = ?, images = ?, error = ?, finished_at = ?, captures = '[]'
+                            WHERE id = ?
+                            """,
+                            (status, images, error, datetime.utcnow().isoformat(), job_id),
+                        )
+                finally:
+                    conn.close()
+                return
+            except Exception:
+                logger.exception("Error finishing enrollment job %s, retrying", job_id)
+                time.sleep(self.poll_interval)
+
+    def _run(self):
+        last_sweep = None
+        while True:
+            # Swept on every round, not only at start: a worker that dies
+            # after this one started leaves its job running otherwise.
+            if last_sweep is None or time.monotonic() - last_sweep >= self.poll_interval:
+                last_sweep = time.monotonic()
+                try:
+                    self._requeue_stale()
+                except Exception:
+                    logger.exception("Error requeuing stale enrollment jobs")
+
+            # Cleared before looking, so a notify() during the claim is not lost.
+            self._wake.clear()
+            try:
+                job = self._claim()
+            except Exception:
+                logger.exception("Error claiming enrollment job")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                continue
+
+            try:
+                images = self.process_job(job)
+            except Exception as exc:
+                self._finish(job["id"], "failed", error=str(exc))
+                continue
+            self._finish(job["id"], "done", images=images)
@@ -0,0 +1,209 @@
+from ann_index import DEFAULT_N_PROBE, IVFIndex
+from deepface import DeepFace
+import numpy as np
+import threading
+
+# Same configuration DeepFace.find used for the Images/ representation pickle.
+MODEL_NAME = "VGG-Face"
+DETECTOR_BACKEND = "opencv"
+NORMALIZATION = "base"
+DISTANCE_THRESHOLD = 0.68
+EMBEDDING_CONFIG = (MODEL_NAME, DETECTOR_BACKEND, NORMALIZATION)
+
+
+def l2_normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[np.newaxis, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def embedding_to_blob(vector):
+    return l2_normalize(vector)[0].tobytes()
+
+
+def blobs_to_matrix(blobs, dimensions):
+    if not blobs:
+        return np.empty((0, dimensions), dtype=np.float32)
+    return np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), dimensions)
+
+
+def represent_image(img):
+    results = DeepFace.represent(
+        img_path=img,
+        model_name=MODEL_NAME,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False,
+        align=True,
+        normalization=NORMALIZATION,
+    )
+    return [result["embedding"] for result in results]
+
+
+def _face_to_bgr(face):
+    # extract_faces returns aligned RGB crops scaled to [0, 1].
+    return np.ascontiguousarray((face[:, :, ::-1] * 255).astype(np.uint8))
+
+
+def represent_crops(crops):
+    if not crops:
+        return []
+    results = DeepFace.represent(
+        img_path=list(crops),
+        model_name=MODEL_NAME,
+        detector_backend="skip",
+        enforce_detection=False,
+        normalization=NORMALIZATION,
+    )
+    # A batch of one may come back unnested.
+    if results and isinstance(results[0], dict):
+        results = [[result] for result in results]
+    return [faces[0]["embedding"] for faces in results]
+
+
+def detect_faces(img):
+    faces = DeepFace.extract_faces(
+        img_path=img,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False,
+        align=True,
+    )
+    return [
+        {
+            "crop": _face_to_bgr(face["face"]),
+            "facial_area": face["facial_area"],
+            "confidence": face.get("confidence", 0),
+        }
+        for face in faces
+    ]
+
+
+def warmup_models():
+    DeepFace.build_model(model_name=MODEL_NAME)
+    DeepFace.build_model(model_name=DETECTOR_BACKEND, task="face_detector")
+    # One dummy pass so the first real frame does not pay for graph tracing.
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    detect_faces(dummy)
+    represent_crops([dummy])
+
+
+class FaceGallery:
+    def __init__(self, ann_min_size=None, ann_n_probe=DEFAULT_N_PROBE):
+        # ann_min_size=None keeps exact search regardless of gallery size.
+        self.ann_min_size = ann_min_size
+        self.ann_n_probe = ann_n_probe
+        self._lock = threading.Lock()
+        # Readers grab this tuple once; writers swap in a new one.
+        self._state = (
+            np.empty((0, 0), dtype=np.float32),
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64),
+            None,
+        )
+
+    def __len__(self):
+        return len(self._state[1])
+
+    def _build_index(self, embeddings, index=None):
+        if self.ann_min_size is None or len(embeddings) < self.ann_min_size:
+            return None
+        # Retrain once the gallery has grown well past what the lists were fit on.
+        if index is None or len(embeddings) > 4 * index.trained_size:
+            return IVFIndex.build(embeddings, n_probe=self.ann_n_probe)
+        return index.extend(embeddings[len(index.assignments):])
+
+    def load(self, image_ids, student_ids, vectors):
+        if len(vectors):
+            embeddings = np.ascontiguousarray(l2_normalize(vectors))
+        else:
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        index = self._build_index(embeddings)
+        with self._lock:
+            self._state = (
+                embeddings,
+                np.asarray(student_ids, dtype=np.int64),
+                np.asarray(image_ids, dtype=np.int64),
+                index,
+            )
+
+    def add(self, image_ids, student_ids, vectors):
+        if not len(vectors):
+            return
+        image_ids = np.asarray(image_ids, dtype=np.int64)
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        new_embeddings = l2_normalize(vectors)
+        with self._lock:
+            embeddings, current_students, current_images, index = self._state
+            # Images already present (a sync from the database may race the
+            # caller's own add) are skipped.
+            fresh = ~np.isin(image_ids, current_images)
+            if not fresh.any():
+                return
+            image_ids = image_ids[fresh]
+            student_ids = student_ids[fresh]
+            new_embeddings = new_embeddings[fresh]
+            if len(current_students):
+                new_embeddings = np.concatenate([embeddings, new_embeddings])
+            new_embeddings = np.ascontiguousarray(new_embeddings)
+            self._state = (
+                new_embeddings,
+                np.concatenate([current_students, student_ids]),
+                np.concatenate([current_images, image_ids]),
+                self._build_index(new_embeddings, index),
+            )
+
+    def remove_student(self, student_id):
+        with self._lock:
+            embeddings, student_ids, image_ids, index = self._state
+            keep = student_ids != student_id
+            if keep.all():
+                return
+            self._state = (
+                np.ascontiguousarray(embeddings[keep]),
+                student_ids[keep],
+                image_ids[keep],
+                index.subset(keep) if index is not None else None,
+            )
+
+    def _candidate_rows(self, queries, student_ids, index, candidate_ids):
+        subset_rows = None
+        if candidate_ids is not None:
+            subset_rows = np.flatnonzero(
+                np.isin(student_ids, np.fromiter(candidate_ids, dtype=np.int64))
+            )
+            # A small roster is cheaper to scan exactly than to probe.
+            if index is None or len(subset_rows) <= index.expected_rows():
+                return subset_rows
+
+        if index is None:
+            return None
+
+        rows = index.candidate_rows(queries)
+        if subset_rows is not None:
+            rows = np.intersect1d(rows, subset_rows, assume_unique=True)
+        return rows
+
+    def match(self, query_embeddings, candidate_ids=None, threshold=DISTANCE_THRESHOLD):
+        embeddings, student_ids, _, index = self._state
+        queries = l2_normalize(query_embeddings)
+
+        rows = self._candidate_rows(queries, student_ids, index, candidate_ids)
+        if rows is not None:
+            embeddings = embeddings[rows]
+            student_ids = student_ids[rows]
+        if len(student_ids) == 0:
+            return [None] * len(queries)
+
+        similarities = queries @ embeddings.T
+        best_rows = similarities.argmax(axis=1)
+
+        matches = []
+        for query_index, row in enumerate(best_rows):
+            distance = 1.0 - float(similarities[query_index, row])
+            if distance > threshold:
+                matches.append(None)
+            else:
+                matches.append((int(student_ids[row]), distance))
+        return matches
@@ -0,0 +1,104 @@
+import itertools
+import time
+
+DEFAULT_IOU_THRESHOLD = 0.3
+DEFAULT_MAX_MISSED = 10
+DEFAULT_REVERIFY_SECONDS = 10.0
+DEFAULT_UNKNOWN_RETRY_SECONDS = 1.0
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = min(ax + aw, bx + bw) - max(ax, bx)
+    inter_h = min(ay + ah, by + bh) - max(ay, by)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    intersection = inter_w * inter_h
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.identity = None
+        self.missed = 0
+        self.last_attempt = None
+
+    def needs_recognition(self, now, reverify_seconds, unknown_retry_seconds):
+        if self.last_attempt is None:
+            return True
+        interval = reverify_seconds if self.identity is not None else unknown_retry_seconds
+        return now - self.last_attempt >= interval
+
+    def set_identity(self, identity, now):
+        self.identity = identity
+        self.last_attempt = now
+
+
+class FaceTracker:
+    # Greedy IoU association of detector boxes across frames. Each track keeps
+    # the identity it was recognised as, so only new tracks, unknown tracks
+    # (every unknown_retry_seconds) and tracks due for re-verification
+    # (every reverify_seconds) need an embedding.
+
+    def __init__(
+        self,
+        iou_threshold=DEFAULT_IOU_THRESHOLD,
+        max_missed=DEFAULT_MAX_MISSED,
+        reverify_seconds=DEFAULT_REVERIFY_SECONDS,
+        unknown_retry_seconds=DEFAULT_UNKNOWN_RETRY_SECONDS,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_seconds = reverify_seconds
+        self.unknown_retry_seconds = unknown_retry_seconds
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def reset(self):
+        self.tracks = []
+
+    def update(self, boxes):
+        pairs = sorted(
+            (
+                (box_iou(track.box, box), track_index, box_index)
+                for track_index, track in enumerate(self.tracks)
+                for box_index, box in enumerate(boxes)
+            ),
+            reverse=True,
+        )
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for iou, track_index, box_index in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_index in used_tracks or assigned[box_index] is not None:
+                continue
+            track = self.tracks[track_index]
+            track.box = boxes[box_index]
+            track.missed = 0
+            assigned[box_index] = track
+            used_tracks.add(track_index)
+
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in used_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for box_index, box in enumerate(boxes):
+            if assigned[box_index] is None:
+                track = Track(next(self._ids), box)
+                self.tracks.append(track)
+                assigned[box_index] = track
+        return assigned
+
+    def pending(self, tracks, now=None):
+        now = time.monotonic() if now is None else now
+        return [
+            track
+            for track in tracks
+            if track.needs_recognition(now, self.reverify_seconds, self.unknown_retry_seconds)
+        ]
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+SIGNATURE_SIZE = (32, 24)
+# Mean absolute grey-level difference (0-255) below which two frames count as the same scene.
+DEFAULT_THRESHOLD = 5.0
+DEFAULT_MAX_REUSE_SECONDS = 30.0
+
+
+def frame_signature(frame):
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(frame, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.int16)
+
+
+class FrameGate:
+    # Remembers, per key (a session or a camera), the downscaled frame the last
+    # inference ran on and its result. A new frame that barely differs from it
+    # reuses that result instead of going through recognition again.
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_reuse_seconds=DEFAULT_MAX_REUSE_SECONDS):
+        self.threshold = threshold
+        self.max_reuse_seconds = max_reuse_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def check(self, key, frame):
+        signature = frame_signature(frame)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return signature, None
+
+        previous_signature, result, stored_at = entry
+        if time.monotonic() - stored_at > self.max_reuse_seconds:
+            return signature, None
+        if float(np.abs(signature - previous_signature).mean()) > self.threshold:
+            return signature, None
+        return signature, result
+
+    def update(self, key, signature, result):
+        with self._lock:
+            self._entries[key] = (signature, result, time.monotonic())
+
+    def forget(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
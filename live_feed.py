@@ -0,0 +1,44 @@
+from collections import defaultdict
+import json
+import threading
+
+
+class AttendanceFeed:
+    # In-process wake-up signal for the dashboards streaming a session.
+    # Subscribers are only told that a session has new records; they read
+    # the records themselves from the database, so a notification that
+    # arrives late, out of order or not at all (another server process
+    # wrote the row) never loses one.
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id):
+        subscription = threading.Event()
+        with self._lock:
+            self._subscribers[session_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, session_id, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def notify(self, session_id):
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, ()))
+        for subscription in subscribers:
+            subscription.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+def format_event(record):
+    return f"id: {record['id']}\nevent: record\ndata: {json.dumps(record)}\n\n"
@@ -0,0 +1,61 @@
+from collections import deque
+import threading
+import time
+
+
+class DropOldestQueue:
+    # Bounded queue for live frames: when full, put() discards the oldest item
+    # so a slow consumer always works on recent data and never blocks the producer.
+
+    def __init__(self, maxsize):
+        self._items = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        with self._condition:
+            if not self._items and not self._condition.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+
+class StageCounter:
+    # Items processed by one pipeline stage, with a rate over the last window seconds.
+
+    def __init__(self, name, window=5.0):
+        self.name = name
+        self.window = window
+        self.total = 0
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def tick(self, count=1):
+        now = time.monotonic()
+        with self._lock:
+            self.total += count
+            self._times.extend([now] * count)
+            self._trim(now)
+
+    def rate(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return len(self._times) / self.window
+
+    def _trim(self, now):
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def __str__(self):
+        return f"{self.name} {self.rate():.1f}/s"
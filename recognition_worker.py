@@ -0,0 +1,87 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class RecognitionExecutor:
+    # Frames are queued by request threads and processed by a few inference
+    # threads. Each thread drains up to max_batch frames (waiting at most
+    # batch_window seconds for more) so concurrent classrooms share one
+    # forward pass.
+
+    def __init__(self, process_batch, workers=1, queue_size=32, max_batch=8, batch_window=0.02):
+        self.process_batch = process_batch
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"recognition-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def submit(self, payload):
+        future = Future()
+        try:
+            self._queue.put_nowait((payload, future))
+        except queue.Full as exc:
+            raise QueueFullError("Recognition queue is full") from exc
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            batch = [
+                (payload, future)
+                for payload, future in batch
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                results = self.process_batch([payload for payload, _ in batch])
+            except Exception as exc:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(exc)
+                else:
+                    # One bad frame must not fail the whole batch: retry each
+                    # frame on its own so only the culprit gets the error.
+                    self._run_one_by_one(batch)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_one_by_one(self, batch):
+        for payload, future in batch:
+            try:
+                future.set_result(self.process_batch([payload])[0])
+            except Exception as exc:
+                future.set_exception(exc)
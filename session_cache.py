@@ -0,0 +1,69 @@
+import threading
+import time
+
+DEFAULT_CHECK_INTERVAL = 1.0
+
+ACTIVE_SESSION_QUERY = """
+    SELECT id FROM sessions
+    WHERE professor_id = ? AND is_active = 1
+    ORDER BY id DESC LIMIT 1
+"""
+
+
+class ActiveSessionCache:
+    # Active session id per professor, kept in process memory.
+    #
+    # start/stop update the cache explicitly through set(). Other workers'
+    # changes are picked up through the "sessions" row of cache_versions,
+    # which triggers bump on every insert into / is_active update of sessions:
+    # at most every check_interval seconds the version is re-read and the
+    # cache is dropped if it moved. check_interval=None skips the check for
+    # single-process deployments.
+
+    def __init__(self, get_connection, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.get_connection = get_connection
+        self.check_interval = check_interval
+        self._sessions = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_version(self, conn):
+        row = conn.execute("SELECT version FROM cache_versions WHERE name = 'sessions'").fetchone()
+        return row["version"] if row else None
+
+    def _revalidate(self):
+        now = time.monotonic()
+        if self.check_interval is None or now - self._checked_at < self.check_interval:
+            return
+        conn = self.get_connection()
+        try:
+            version = self._read_version(conn)
+        finally:
+            conn.close()
+        with self._lock:
+            if version != self._version:
+                self._sessions.clear()
+                self._version = version
+            self._checked_at = now
+
+    def get(self, professor_id):
+        self._revalidate()
+        with self._lock:
+            if professor_id in self._sessions:
+                return self._sessions[professor_id]
+
+        conn = self.get_connection()
+        try:
+            row = conn.execute(ACTIVE_SESSION_QUERY, (professor_id,)).fetchone()
+        finally:
+            conn.close()
+
+        session_id = row["id"] if row else None
+        with self._lock:
+            self._sessions[professor_id] = session_id
+        return session_id
+
+    def set(self, professor_id, session_id):
+        with self._lock:
+            self._sessions[professor_id] = session_id
@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="attendance-test-")
+os.environ["ATTENDANCE_DB_PATH"] = os.path.join(_workdir, "test.db")
+os.environ["ATTENDANCE_UPLOAD_DIR"] = os.path.join(_workdir, "Images")
+os.environ["WARMUP_ON_IMPORT"] = "0"
+
+import app  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def plans():
+    return app.audit_query_plans()
+
+
+@pytest.mark.parametrize("name", sorted(app.HOT_QUERIES))
+def test_hot_query_uses_index(plans, name):
+    assert app.plan_uses_index(plans[name]), plans[name]